@@ -0,0 +1,76 @@
+# Time and peak memory of muting many intervals of a long recording and writing it out: pydub slicing and
+# concatenation with the beep (the pydub engine of anonymize) against the numpy engine streaming a memory mapped wav.
+# No models needed.
+# usage: python benchmarks/anonymize_export.py [minutes] [intervals_per_minute]
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from multimodal.pcm import ms_to_sample_intervals, wav_memmap, write_filled_wav
+
+BEEP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "multimodal", "resources",
+                         "beep.wav")
+
+
+def pydub_export(wav_path, mute_ms, out_path):
+    from pydub import AudioSegment
+    sound = AudioSegment.from_wav(wav_path)
+    beep = AudioSegment.from_wav(BEEP_PATH)
+    pieces, last = [sound[:mute_ms[0][0]]], mute_ms[0][1]
+    for start, end in mute_ms[1:]:
+        pieces.append(sound[last:start])
+        last = end
+    pieces.append(sound[last:])
+    muted = pieces[0]
+    for piece in pieces[1:]:
+        muted = muted + beep + piece
+    muted.export(out_path, format="wav")
+
+
+def numpy_export(wav_path, mute_ms, out_path):
+    samples, rate = wav_memmap(wav_path)
+    with wave.open(BEEP_PATH, "rb") as wf:
+        beep = np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2')
+    write_filled_wav(out_path, samples, rate, ms_to_sample_intervals(mute_ms, rate, len(samples)), beep)
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2 ** 20
+
+
+def main(minutes=30, intervals_per_minute=20, rate=16000):
+    folder = tempfile.mkdtemp(prefix="multimodal-anonymize-")
+    try:
+        wav_path = os.path.join(folder, "long.wav")
+        rng = np.random.RandomState(0)
+        with wave.open(wav_path, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(rate)
+            for _ in range(minutes):
+                wf.writeframes(rng.randint(-3000, 3000, rate * 60).astype('<i2').tobytes())
+        step = 60000 // intervals_per_minute
+        mute_ms = [(start, start + 400) for start in range(step // 2, minutes * 60000, step)]
+        pydub_seconds, pydub_peak = measure(pydub_export, wav_path, mute_ms, os.path.join(folder, "pydub.wav"))
+        numpy_seconds, numpy_peak = measure(numpy_export, wav_path, mute_ms, os.path.join(folder, "numpy.wav"))
+        print("recording / intervals : {} min / {}".format(minutes, len(mute_ms)))
+        print("pydub                 : {:.2f} s, peak {:.0f} MB".format(pydub_seconds, pydub_peak))
+        print("numpy streaming       : {:.2f} s, peak {:.1f} MB".format(numpy_seconds, numpy_peak))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
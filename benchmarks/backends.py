@@ -0,0 +1,40 @@
+# Latency, memory and output agreement of the int8 and onnx backends against fp32 for one transformers task.
+# Runs against the locally downloaded model, converted models are cached next to it.
+# usage: python benchmarks/backends.py [task] [backend ...]
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from multimodal.backends import BACKENDS, compare_backends
+from multimodal.model_loader import _read_file_info
+
+SENTENCES = ["Leonardo DiCaprio spoke at the United Nations climate summit in New York.",
+             "The weather today is awful and the trains are late again.",
+             "I really enjoyed the concert, the band was fantastic.",
+             "Microsoft and Google announced new offices in London and Paris."]
+CONTEXT = " ".join(SENTENCES)
+QUESTIONS = ["Who spoke at the summit?", "Where are the new offices?", "How was the band?"]
+
+
+def samples(task):
+    if task == 'question-answering':
+        return [{'question': question, 'context': CONTEXT} for question in QUESTIONS]
+    return SENTENCES
+
+
+def main(task='sentiment-analysis', backends=BACKENDS,
+         model_path=os.path.join(os.path.expanduser("~"), "multimodal", "resources")):
+    folder = os.path.join(model_path, _read_file_info()[task]['folder'])
+    print("{:<8}{:>10}{:>14}{:>12}{:>12}{:>11}".format("backend", "load s", "latency ms", "rss MB", "model MB",
+                                                      "agreement"))
+    for report in compare_backends(task, folder, samples(task), backends):
+        if 'error' in report:
+            print("{:<8}  {}".format(report['backend'], report['error']))
+            continue
+        print("{:<8}{:>10.2f}{:>14.1f}{:>12.1f}{:>12.1f}{:>11.0%}".format(
+            report['backend'], report['load_seconds'], report['latency_seconds'] * 1000,
+            report['rss_delta_bytes'] / 2 ** 20, report['model_bytes'] / 2 ** 20, report['agreement']))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *([tuple(sys.argv[2:])] if len(sys.argv) > 2 else []))
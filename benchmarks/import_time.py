@@ -0,0 +1,49 @@
+# Measures the cold import cost of "import multimodal" against importing the heavy dependencies
+# that the package used to import eagerly at module level.
+# usage: python benchmarks/import_time.py [repeats]
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ['torch', 'transformers', 'vosk', 'youtube_dl', 'pydub', 'pdfminer.high_level', 'docx', 'pyttsx3',
+                 'gdown', 'pandas']
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _available(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def _time_import(code, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=REPO_ROOT)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(repeats=5):
+    heavy = [m for m in HEAVY_MODULES if _available(m)]
+    baseline = _time_import("pass", repeats)
+    lazy = _time_import("import multimodal", repeats)
+    eager = _time_import("import multimodal; " + "; ".join("import " + m for m in heavy), repeats) if heavy \
+        else lazy
+    leaked = subprocess.run([sys.executable, "-c", "import sys, multimodal; print(','.join(m for m in " +
+                             repr(HEAVY_MODULES) + " if m in sys.modules))"], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True).stdout.strip()
+    print("interpreter start-up          : {:.3f} s".format(baseline))
+    print("import multimodal (lazy)      : {:.3f} s".format(lazy))
+    print("import multimodal + heavy deps: {:.3f} s  ({})".format(eager, ", ".join(heavy) or "none installed"))
+    print("saved on cold import          : {:.3f} s".format(eager - lazy))
+    print("heavy modules loaded by import: " + (leaked or "none"))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,54 @@
+# Sentences per second of the NER pipeline called once per sentence against length bucketed batches,
+# as done by speech_ner_anonymizer. Runs against the locally downloaded NER model.
+# usage: python benchmarks/ner_batching.py [n_sentences] [batch_size]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from multimodal.batching import run_batched
+from multimodal.model_loader import ModelLoader
+
+NAMES = ["john", "mary", "samuel", "leonardo", "paris", "london", "united nations", "microsoft", "india"]
+WORDS = ["the", "climate", "is", "changing", "and", "we", "need", "to", "act", "now", "said", "in", "a", "speech",
+         "today", "about", "our", "future", "planet", "people"]
+
+
+def synthetic_sentences(n, seed=0):
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(n):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(4, 40))]
+        for _ in range(rng.randint(0, 3)):
+            words.insert(rng.randrange(len(words)), rng.choice(NAMES))
+        sentences.append(" ".join(words))
+    return sentences
+
+
+def main(n_sentences=256, batch_size=16,
+         model_path=os.path.join(os.path.expanduser("~"), "multimodal", "resources")):
+    loader = ModelLoader(model_path)
+    loader.tasks = ['ner']
+    loader._download_load_models()
+    sentences = synthetic_sentences(n_sentences)
+    loader.nlp(sentences[0])
+
+    start = time.perf_counter()
+    single = [loader.nlp(sentence) for sentence in sentences]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = run_batched(loader.nlp, sentences, batch_size=batch_size, empty_result=[])
+    batched_time = time.perf_counter() - start
+
+    same = sum([e['word'] for e in a] == [e['word'] for e in b] for a, b in zip(single, batched))
+    print("sentences           : {}".format(n_sentences))
+    print("per sentence        : {:.1f} sentences/s".format(n_sentences / single_time))
+    print("batched (size {:>3}) : {:.1f} sentences/s".format(batch_size, n_sentences / batched_time))
+    print("speed-up            : {:.2f}x".format(single_time / batched_time))
+    print("identical entities  : {}/{}".format(same, n_sentences))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,101 @@
+# NER span merging and word alignment of _mute_ner on long, entity dense synthetic transcripts: the previous
+# implementation (re-sorting and rescanning the pieces on every step, matching words by text) against the single
+# sorted pass with the offset index. No models needed.
+# usage: python benchmarks/ner_span_merge.py [n_words] [entity_ratio]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from multimodal.spans import merge_entity_pieces, word_offsets, span_word_indexes
+
+WORDS = ["the", "climate", "is", "changing", "and", "we", "need", "to", "act", "now", "said", "in", "a", "speech",
+         "today", "about", "our", "future", "planet", "people"]
+ENTITIES = [("leonardo dicaprio", "PER"), ("samuel", "PER"), ("paris", "LOC"), ("new york", "LOC"),
+            ("united nations", "ORG"), ("microsoft", "ORG")]
+
+
+def old_merge_rec_ner(text, prediction):
+    merged_prediction = []
+    while len(prediction) > 0:
+        prediction.sort(key=lambda x: x['start'])
+        current = prediction[0]
+        current_tag = prediction[0]['entity'][2:]
+        neighbours = list(filter(
+            lambda x: (current['start'] == x['end'] or current['end'] == x['start']) and current['entity'][2:] ==
+                      x['entity'][2:], prediction))
+        if len(neighbours) >= 1:
+            start = min([current] + neighbours, key=lambda x: x['start'])['start']
+            end = max([current] + neighbours, key=lambda x: x['end'])['end']
+            score = min([current] + neighbours, key=lambda x: x['score'])['score']
+            prediction.append({'start': start, 'end': end, 'entity': current_tag, 'score': score})
+            for neighbour in neighbours:
+                prediction.remove(neighbour)
+        else:
+            merged_prediction.append(
+                {'beginPosition': current['start'], 'endPosition': current['end'], 'conceptType': current_tag,
+                 'score': current['score']})
+        prediction.remove(current)
+    for entity in merged_prediction:
+        entity['text'] = text[entity['beginPosition']:entity['endPosition']]
+    return merged_prediction
+
+
+def old_mute_words(rec_dict, spans):
+    ner_tokens = [tok for span in spans for tok in span['text'].split(" ")]
+    return list(filter(lambda x: any([x['word'] in ner_tokens]), rec_dict['result']))
+
+
+def new_mute_words(rec_dict, spans):
+    words = rec_dict['result']
+    word_texts = [x['word'] for x in words]
+    return [words[i] for i in span_word_indexes(word_offsets(rec_dict['text'], word_texts), word_texts, spans)]
+
+
+def synthetic_sentence(n_words, entity_ratio, seed=0):
+    # a vosk like result with word times and the NER pieces a wordpiece tokenizer would give for it, entity words
+    # are cut into pieces of up to 4 characters labelled B-/I-
+    rng = random.Random(seed)
+    words, pieces, position = [], [], 0
+    while len(words) < n_words:
+        if rng.random() < entity_ratio:
+            entity, tag = rng.choice(ENTITIES)
+            for i, word in enumerate(entity.split(" ")):
+                for j in range(0, len(word), 4):
+                    pieces.append({'start': position + j, 'end': position + min(j + 4, len(word)), 'score': 0.99,
+                                   'entity': ("B-" if i == 0 and j == 0 else "I-") + tag})
+                words.append(word)
+                position += len(word) + 1
+        else:
+            words.append(rng.choice(WORDS))
+            position += len(words[-1]) + 1
+    result = [{'word': word, 'start': i * 0.3, 'end': i * 0.3 + 0.25, 'conf': 1.0} for i, word in enumerate(words)]
+    return {'text': " ".join(words), 'result': result}, pieces
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    return value, time.perf_counter() - start
+
+
+def main(n_words=4000, entity_ratio=0.3):
+    rec_dict, pieces = synthetic_sentence(n_words, entity_ratio)
+    old_spans, old_merge_time = timed(old_merge_rec_ner, rec_dict['text'], list(pieces))
+    new_spans, new_merge_time = timed(merge_entity_pieces, rec_dict['text'], list(pieces))
+    old_words, old_align_time = timed(old_mute_words, rec_dict, old_spans)
+    new_words, new_align_time = timed(new_mute_words, rec_dict, new_spans)
+    entity_words = sum(1 for span in new_spans for _ in span['text'].split(" "))
+    print("words / entity pieces   : {} / {}".format(n_words, len(pieces)))
+    print("merge        old / new  : {:.3f} s / {:.4f} s ({:.0f}x)".format(old_merge_time, new_merge_time,
+                                                                          old_merge_time / new_merge_time))
+    print("alignment    old / new  : {:.3f} s / {:.4f} s ({:.0f}x)".format(old_align_time, new_align_time,
+                                                                          old_align_time / new_align_time))
+    print("spans        old / new  : {} / {}".format(len(old_spans), len(new_spans)))
+    print("muted words  old / new  : {} / {} (words inside entity spans: {})".format(len(old_words), len(new_words),
+                                                                                     entity_words))
+
+
+if __name__ == '__main__':
+    main(*[int(sys.argv[1])] if len(sys.argv) > 1 else [], *[float(sys.argv[2])] if len(sys.argv) > 2 else [])
@@ -0,0 +1,302 @@
+# End to end benchmark of every task of tasks.tsv on deterministic inputs: WAVs of fixed lengths generated from the
+# bundled speech recording (or a synthetic signal), the bundled pdf and a synthetic docx. Every task runs in its own
+# process, so that model load time and peak RSS belong to that task only. Reports per stage timings, real time
+# factors, peak RSS and model load time, writes them as JSON and compares them against a stored baseline.
+# Runs offline, the models must already be under model_path.
+# usage: python benchmarks/run_benchmarks.py [--tasks ...] [--durations 10 60] [--output results.json]
+#                                            [--baseline baseline.json] [--save-baseline baseline.json]
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+DEFAULT_MODEL_PATH = os.path.join(os.path.expanduser("~"), "multimodal", "resources")
+SPEECH_RECORDING = os.path.join(REPO_ROOT, "test_files", "Leonardo DiCaprios Powerful Climate Summit Speech.mp3")
+PDF_PATH = os.path.join(REPO_ROOT, "test_files", "1907.11932.pdf")
+QUESTIONS = ["Who is Samuel?", "What is changing?", "Where was the speech given?"]
+WORDS = ["the", "climate", "is", "changing", "and", "we", "need", "to", "act", "now", "said", "in", "a", "speech",
+         "today", "about", "our", "future", "planet", "people", "Leonardo", "Paris", "United Nations", "London"]
+FREQUENCY = 16000
+
+
+def synthetic_signal(seconds, seed=0):
+    # voiced syllables of a few harmonics under a smooth envelope, separated by short and long pauses
+    import numpy as np
+    rng = np.random.RandomState(seed)
+    samples = np.zeros(int(seconds * FREQUENCY), dtype=np.float32)
+    position = 0
+    while position < len(samples):
+        length = int(rng.uniform(0.12, 0.35) * FREQUENCY)
+        t = np.arange(length) / FREQUENCY
+        pitch = rng.uniform(100, 220)
+        syllable = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6)) * np.hanning(length)
+        end = min(len(samples), position + length)
+        samples[position:end] = syllable[:end - position] * 0.3
+        position = end + int((rng.uniform(0.5, 1.0) if rng.rand() < 0.15 else rng.uniform(0.02, 0.1)) * FREQUENCY)
+    samples += rng.normal(0, 0.003, len(samples)).astype(np.float32)
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2')
+
+
+def recording_signal(seconds, ffmpeg_path, path=SPEECH_RECORDING):
+    # the recording decoded once and repeated up to the wanted length
+    import numpy as np
+    from multimodal.pcm import decode_ffmpeg
+    speech = decode_ffmpeg(ffmpeg_path, path, FREQUENCY)
+    return np.resize(speech, int(seconds * FREQUENCY))
+
+
+def write_wav(path, samples):
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(FREQUENCY)
+        wf.writeframes(samples.tobytes())
+
+
+def write_docx(path, n_paragraphs=20, seed=0):
+    import docx
+    rng = random.Random(seed)
+    document = docx.Document()
+    for _ in range(n_paragraphs):
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+                     for _ in range(rng.randint(1, 4))]
+        document.add_paragraph(" ".join(sentences))
+    document.save(path)
+
+
+def make_inputs(folder, durations, speech='recording'):
+    ffmpeg_path = shutil.which('ffmpeg')
+    if speech == 'recording' and not ffmpeg_path:
+        print("ffmpeg not found, using the synthetic signal instead of the speech recording.")
+        speech = 'synthetic'
+    inputs = {'audio': [], 'doc': []}
+    for seconds in durations:
+        path = os.path.join(folder, "{}_{}s.wav".format(speech, seconds))
+        write_wav(path, recording_signal(seconds, ffmpeg_path) if speech == 'recording'
+                  else synthetic_signal(seconds))
+        inputs['audio'].append({'name': os.path.basename(path), 'path': path, 'seconds': seconds})
+    inputs['doc'].append({'name': os.path.basename(PDF_PATH), 'path': PDF_PATH, 'max_pages': 2})
+    docx_path = os.path.join(folder, "synthetic.docx")
+    write_docx(docx_path)
+    inputs['doc'].append({'name': os.path.basename(docx_path), 'path': docx_path})
+    return inputs
+
+
+def _peak_rss_mb():
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages, self.errors = {}, {}
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors[stage] = repr(e)
+        self.stages[stage] = time.perf_counter() - start
+
+
+def _run_audio_task(mm, mmtask, item, export_folder):
+    from multimodal import transcript_cache
+    transcript_cache.clear()
+    session = mm.session()
+    timer = StageTimer()
+    with timer('decode'):
+        session.load(item['path'])
+    # the transcript is cached by the stt stage, the nlp stage replays it without decoding again
+    with timer('stt'):
+        session._listen(sentence_wise=False)
+    with timer('nlp'):
+        if mmtask == 'speech_ner_anonymizer':
+            session.anonymize(print_processing=False)
+        elif mmtask == 'speech_sentiment':
+            session.get_sentiment(print_processing=False)
+        elif mmtask == 'speech_question_answering':
+            session.get_answers(QUESTIONS, print_processing=False)
+        elif mmtask == 'speech_generation':
+            session.generate(print_processing=False, n_sentences=2)
+        elif mmtask == 'speech_analysis':
+            session.analyze(questions=QUESTIONS)
+    if mmtask in ('speech_ner_anonymizer', 'speech_analysis', 'speech_generation'):
+        with timer('export'):
+            if mmtask == 'speech_generation':
+                session.render(generated=True)
+            session.export(os.path.join(export_folder, mmtask + "_" + item['name']))
+    return timer
+
+
+def _run_doc_task(mm, mmtask, item, export_folder):
+    session = mm.session()
+    timer = StageTimer()
+    with timer('decode'):
+        session.load(item['path'], max_pages=item.get('max_pages', 2))
+    with timer('export'):
+        session.render()
+        session.export(os.path.join(export_folder, mmtask + "_" + os.path.splitext(item['name'])[0] + ".wav"))
+    return timer
+
+
+def run_task(mmtask, inputs, model_path, repeats):
+    # one task in this process: load the models once, then time every input repeats times and keep the medians
+    from multimodal import MultiModal
+    from multimodal.server import _use_offline_models
+    _use_offline_models(model_path, [mmtask])
+    start = time.perf_counter()
+    mm = MultiModal(mmtask, model_path=model_path)
+    model_load_seconds = time.perf_counter() - start
+    results = []
+    export_folder = tempfile.mkdtemp(prefix="multimodal-bench-")
+    try:
+        for item in inputs['audio' if 'speech' in mmtask else 'doc']:
+            timers = [(_run_audio_task if 'speech' in mmtask else _run_doc_task)(mm, mmtask, item, export_folder)
+                      for _ in range(repeats)]
+            stages = {stage: statistics.median(timer.stages[stage] for timer in timers)
+                      for stage in timers[0].stages}
+            result = {'task': mmtask, 'input': item['name'], 'stages': stages,
+                      'total_seconds': sum(stages.values()), 'errors': timers[-1].errors}
+            if 'seconds' in item:
+                result['audio_seconds'] = item['seconds']
+                result['rtf'] = result['total_seconds'] / item['seconds']
+                result['stt_rtf'] = stages['stt'] / item['seconds']
+            results.append(result)
+    finally:
+        shutil.rmtree(export_folder, ignore_errors=True)
+    for result in results:
+        result['model_load_seconds'] = model_load_seconds
+        result['peak_rss_mb'] = _peak_rss_mb()
+    return results
+
+
+def _run_worker(mmtask, inputs_path, model_path, repeats):
+    with open(inputs_path) as f:
+        inputs = json.load(f)
+    # the library reports progress on stdout, only the results go there
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_task(mmtask, inputs, model_path, repeats)
+    print(json.dumps(results))
+
+
+def _spawn(mmtask, inputs_path, model_path, repeats):
+    env = dict(os.environ, HF_HUB_OFFLINE="1", TRANSFORMERS_OFFLINE="1")
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", mmtask, "--inputs", inputs_path,
+                              "--model-path", model_path, "--repeats", str(repeats)],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=REPO_ROOT)
+    if process.returncode != 0:
+        error = process.stderr.decode(errors='replace').strip().splitlines()
+        return [{'task': mmtask, 'input': None, 'error': error[-1] if error else "exit code " +
+                 str(process.returncode)}]
+    return json.loads(process.stdout.decode().strip().splitlines()[-1])
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, cwd=REPO_ROOT).stdout.decode().strip()
+    except OSError:
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'commit': commit or None, 'time': time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def compare(results, baseline, tolerance=0.1, min_seconds=0.05):
+    # stages slower than the baseline by more than tolerance (and min_seconds, to ignore noise on tiny stages)
+    previous = {(r['task'], r['input']): r for r in baseline['results'] if 'stages' in r}
+    regressions = []
+    for result in results:
+        before = previous.get((result['task'], result['input']))
+        if before is None or 'stages' not in result:
+            continue
+        timings = dict(result['stages'], model_load=result['model_load_seconds'])
+        timings_before = dict(before['stages'], model_load=before['model_load_seconds'])
+        for stage, seconds in timings.items():
+            if stage in timings_before and seconds - timings_before[stage] > max(tolerance * timings_before[stage],
+                                                                                 min_seconds):
+                regressions.append({'task': result['task'], 'input': result['input'], 'stage': stage,
+                                    'baseline': timings_before[stage], 'seconds': seconds,
+                                    'change': seconds / timings_before[stage] - 1 if timings_before[stage] else None})
+    return regressions
+
+
+def print_results(results):
+    print("{:<26}{:<22}{:>8}{:>8}{:>8}{:>8}{:>8}{:>8}{:>9}".format("task", "input", "load", "decode", "stt", "nlp",
+                                                                   "export", "rtf", "rss MB"))
+    for r in results:
+        if 'error' in r:
+            print("{:<26}{}".format(r['task'], r['error']))
+            continue
+        stage = lambda name: "{:>8.2f}".format(r['stages'][name]) if name in r['stages'] else "{:>8}".format("-")
+        print("{:<26}{:<22}{:>8.2f}{}{}{}{}{:>8}{:>9.0f}".format(
+            r['task'], r['input'][:21], r['model_load_seconds'], stage('decode'), stage('stt'), stage('nlp'),
+            stage('export'), "{:.2f}".format(r['rtf']) if 'rtf' in r else "-", r['peak_rss_mb']))
+        for stage_name, error in r['errors'].items():
+            print("    {} failed: {}".format(stage_name, error))
+
+
+def main(argv=None):
+    from multimodal.multi_modal import _read_tasks
+    parser = argparse.ArgumentParser(description="End to end benchmark of the multimodal tasks.")
+    parser.add_argument("--tasks", nargs="*", help="tasks of tasks.tsv, all by default")
+    parser.add_argument("--durations", nargs="*", type=float, default=[10, 60], help="lengths of the WAVs in seconds")
+    parser.add_argument("--speech", choices=["recording", "synthetic"], default="recording",
+                        help="WAVs cut from the bundled speech recording or a synthetic signal")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slow down reported as regression")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--inputs", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        return _run_worker(args.worker, args.inputs, args.model_path, args.repeats)
+
+    tasks = args.tasks or list(_read_tasks())
+    input_folder = tempfile.mkdtemp(prefix="multimodal-bench-inputs-")
+    try:
+        inputs_path = os.path.join(input_folder, "inputs.json")
+        with open(inputs_path, 'w') as f:
+            json.dump(make_inputs(input_folder, [int(d) if d == int(d) else d for d in args.durations], args.speech),
+                      f)
+        results = []
+        for mmtask in tasks:
+            print("Benchmarking " + mmtask + " ...")
+            results += _spawn(mmtask, inputs_path, args.model_path, args.repeats)
+    finally:
+        shutil.rmtree(input_folder, ignore_errors=True)
+    report = {'environment': _environment(), 'settings': {'durations': args.durations, 'speech': args.speech,
+                                                          'repeats': args.repeats}, 'results': results}
+    print_results(results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report['regressions'] = compare(results, json.load(f), tolerance=args.tolerance)
+        for regression in report['regressions']:
+            print("Regression {task} {input} {stage}: {baseline:.2f} s -> {seconds:.2f} s".format(**regression))
+        if not report['regressions']:
+            print("No regressions against " + args.baseline)
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# Memory and time range queries of a long synthetic transcript: the list of vosk result dicts kept so far against
+# the columnar TranscriptStore. No models needed.
+# usage: python benchmarks/transcript_store.py [hours] [queries]
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from multimodal.transcript_store import TranscriptStore
+
+WORDS = ["the", "climate", "is", "changing", "and", "we", "need", "to", "act", "now", "said", "in", "a", "speech",
+         "today", "about", "our", "future", "planet", "people", "leonardo", "paris", "united", "nations"]
+
+
+def synthetic_recs(hours, words_per_sentence=12, seed=0):
+    # json parsed results, as the recognizer gives them, about 2.5 words a second
+    rng = random.Random(seed)
+    recs, position = [], 0.0
+    while position < hours * 3600:
+        words = []
+        for _ in range(words_per_sentence):
+            words.append({'conf': rng.random(), 'end': position + 0.3, 'start': position,
+                          'word': rng.choice(WORDS) + ("s" * rng.randint(0, 1))})
+            position += 0.4
+        recs.append({'result': words, 'text': " ".join(word['word'] for word in words)})
+    return recs
+
+
+def build(function, *args):
+    tracemalloc.start()
+    value = function(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size / 2 ** 20
+
+
+def list_between(recs, start, end):
+    return [word for rec_dict in recs for word in rec_dict.get('result', []) if word['end'] > start and
+            word['start'] < end]
+
+
+def main(hours=4, queries=100):
+    recs, list_size = build(synthetic_recs, hours)
+    store, store_size = build(TranscriptStore, recs)
+    rng = random.Random(1)
+    ranges = [(start, start + 60) for start in (rng.uniform(0, hours * 3600 - 60) for _ in range(queries))]
+    start = time.perf_counter()
+    list_words = [list_between(recs, *interval) for interval in ranges]
+    list_time = (time.perf_counter() - start) / queries
+    start = time.perf_counter()
+    store_words = [store.words_between(*interval) for interval in ranges]
+    store_time = (time.perf_counter() - start) / queries
+    print("words / sentences       : {} / {}".format(store.n_words, len(store)))
+    print("memory   dicts / store  : {:.1f} MB / {:.1f} MB".format(list_size, store_size))
+    print("1 minute range query    : {:.2f} ms / {:.2f} ms".format(1000 * list_time, 1000 * store_time))
+    print("same words              : {}".format(list_words == store_words))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,60 @@
+# Real time factor of speech recognition with and without voice activity detection on a sparse recording: the
+# bundled speech cut into pieces separated by long silences. Runs against the locally downloaded vosk model.
+# usage: python benchmarks/vad.py [speech_seconds] [silence_seconds] [pieces]
+import os
+import shutil
+import sys
+import tempfile
+import time
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from multimodal import MultiModal
+from multimodal.pcm import decode_ffmpeg
+
+SPEECH_RECORDING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files",
+                                "Leonardo DiCaprios Powerful Climate Summit Speech.mp3")
+
+
+def sparse_recording(path, speech_seconds, silence_seconds, pieces, rate=16000):
+    speech = decode_ffmpeg(shutil.which('ffmpeg'), SPEECH_RECORDING, rate)
+    rng = np.random.RandomState(0)
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        for i in range(pieces):
+            wf.writeframes(rng.randint(-30, 30, silence_seconds * rate).astype('<i2').tobytes())
+            first = (i * speech_seconds * rate) % max(1, len(speech) - speech_seconds * rate)
+            wf.writeframes(speech[first:first + speech_seconds * rate].tobytes())
+    return pieces * (speech_seconds + silence_seconds)
+
+
+def transcribe(path, vad):
+    mm = MultiModal("speech_sentiment", transcript_cache=False, vad=vad)
+    mm.load(path)
+    start = time.perf_counter()
+    mm.listen()
+    return time.perf_counter() - start, mm.doc[mm.audio_path], mm.vad_stats
+
+
+def main(speech_seconds=10, silence_seconds=30, pieces=6):
+    folder = tempfile.mkdtemp(prefix="multimodal-vad-")
+    try:
+        path = os.path.join(folder, "sparse.wav")
+        seconds = sparse_recording(path, speech_seconds, silence_seconds, pieces)
+        plain_time, plain_text, _ = transcribe(path, False)
+        vad_time, vad_text, stats = transcribe(path, True)
+        words = lambda sentences: " ".join(sentences).split()
+        print("recording            : {} s, {:.0f}% speech".format(seconds, 100 * speech_seconds /
+                                                                   (speech_seconds + silence_seconds)))
+        print("skipped by VAD       : {:.1f} s in {} regions".format(stats['skipped_seconds'], stats['regions']))
+        print("rtf without / with   : {:.3f} / {:.3f}".format(plain_time / seconds, vad_time / seconds))
+        print("words without / with : {} / {}".format(len(words(plain_text)), len(words(vad_text))))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
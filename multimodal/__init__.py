@@ -1,4 +1,25 @@
-from .multi_modal import *
-from .text import *
-from .audio import *
+import importlib
+from .instrumentation import Instrumentation, instrumentation
+from .model_registry import ModelRegistry, registry
+from .transcript_cache import TranscriptCache, transcript_cache
 __version__ = "0.0.1"
+
+# public names resolved on first access, so that "import multimodal" does not pull in torch, vosk, pydub etc.
+_LAZY_ATTRIBUTES = {'MultiModal': 'multi_modal',
+                    'Text': 'text',
+                    'Audio': 'audio',
+                    'ModelLoader': 'model_loader',
+                    'AsyncMultiModal': 'async_api'}
+__all__ = list(_LAZY_ATTRIBUTES) + ['Instrumentation', 'instrumentation', 'ModelRegistry', 'registry', 'TranscriptCache', 'transcript_cache']
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module("." + _LAZY_ATTRIBUTES[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
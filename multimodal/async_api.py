@@ -0,0 +1,91 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from .multi_modal import MultiModal
+
+
+class AsyncMultiModal:
+    # awaitable facade over one model holding MultiModal object. Every call works on its own session, decoding and
+    # speech recognition run on the stt executor, transformers calls on the nlp executor. A single nlp worker by
+    # default, fast tokenizers must not be used from several threads at once.
+    def __init__(self, multimodal, stt_workers=4, nlp_workers=1):
+        self.multimodal = multimodal
+        self.stt_executor = ThreadPoolExecutor(max_workers=stt_workers, thread_name_prefix="multimodal-stt")
+        self.nlp_executor = ThreadPoolExecutor(max_workers=nlp_workers, thread_name_prefix="multimodal-nlp")
+
+    @classmethod
+    async def create(cls, mmtask, stt_workers=4, nlp_workers=1, **kwargs):
+        loop = asyncio.get_running_loop()
+        multimodal = await loop.run_in_executor(None, partial(MultiModal, mmtask, **kwargs))
+        if multimodal is None:
+            raise ValueError("Unknown multimodal task " + repr(mmtask))
+        return cls(multimodal, stt_workers=stt_workers, nlp_workers=nlp_workers)
+
+    async def _run(self, executor, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(function, *args, **kwargs))
+
+    async def load(self, path, **load_options):
+        session = self.multimodal.session()
+        await self._run(self.stt_executor, session.load, path, **load_options)
+        return session
+
+    async def _session(self, source, listen=True, **load_options):
+        # source is a path or a session returned by an earlier call
+        session = source if hasattr(source, 'mmtask') else await self.load(source, **load_options)
+        if listen and session.audio_path and session.audio_path not in session.transcripts:
+            await self._run(self.stt_executor, session._listen, sentence_wise=False)
+        return session
+
+    def _recs(self, session):
+        # the recognition results of the stt stage, the nlp stage never listens (and so never decodes) again
+        return list(session.transcripts[session.audio_path])
+
+    async def listen(self, source, **load_options):
+        session = await self._session(source, **load_options)
+        return session.doc[session.audio_path]
+
+    async def get_answer(self, source, question, top_k=3, **load_options):
+        session = await self._session(source, **load_options)
+        answers = await self._run(self.nlp_executor, session.get_answers, [question], print_processing=False,
+                                  top_k=top_k, listen=False)
+        return answers[0]
+
+    async def get_answers(self, source, questions, top_k=3, **load_options):
+        session = await self._session(source, **load_options)
+        return await self._run(self.nlp_executor, session.get_answers, questions, print_processing=False,
+                               top_k=top_k, listen=False)
+
+    async def get_sentiment(self, source, **load_options):
+        session = await self._session(source, **load_options)
+        await self._run(self.nlp_executor, session.get_sentiment, print_processing=False, recs=self._recs(session))
+        return session.sentiment[session.audio_path]
+
+    async def anonymize(self, source, ner_theta=0.8, ner_window_gap=0.2, export_path=None, **load_options):
+        session = await self._session(source, **load_options)
+        audio = await self._run(self.nlp_executor, session.anonymize, ner_theta=ner_theta,
+                                ner_window_gap=ner_window_gap, print_processing=False, recs=self._recs(session))
+        if export_path:
+            await self._run(self.stt_executor, session.export, export_path)
+        return audio
+
+    async def analyze(self, source, questions=(), ner_theta=0.8, top_k=3, **load_options):
+        session = await self._session(source, **load_options)
+        return await self._run(self.nlp_executor, session.analyze, questions=questions, ner_theta=ner_theta,
+                               top_k=top_k, recs=self._recs(session))
+
+    async def generate(self, source, n_sentences=1, prompt_context=100, **load_options):
+        session = await self._session(source, **load_options)
+        await self._run(self.nlp_executor, session.generate, print_processing=False, prompt_context=prompt_context,
+                        n_sentences=n_sentences)
+        context_path, _ = session._get_input_path()
+        return session.generated_texts.get(context_path, [])
+
+    def close(self):
+        self.stt_executor.shutdown(wait=True)
+        self.nlp_executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
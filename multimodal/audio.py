@@ -1,27 +1,162 @@
+import asyncio
+import io
+import json
+import math
 import os
 import re
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 import wave
-from pydub import AudioSegment
-import numpy as np
-import youtube_dl
-from vosk import KaldiRecognizer
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from .instrumentation import instrumentation
 from .model_loader import ModelLoader
-import pyttsx3
+from .pcm import split_points, shift_rec_times, decode_ffmpeg, PcmReader, wav_memmap, apply_fill, write_filled_wav, \
+    speech_regions, compress_regions, restore_rec_times, replacing
+from .transcript_cache import transcript_cache, file_content_hash, transcript_key
+from .transcript_store import TranscriptStore
+
+
+def _decode_wave(wf, rec, block_frames=4000, tick=False):
+    # with tick=True a None is yielded for every block that did not complete a sentence
+    timed = instrumentation.enabled
+    while True:
+        data = wf.readframes(block_frames)
+        if len(data) == 0:
+            break
+        start = time.perf_counter() if timed else None
+        accepted = rec.AcceptWaveform(data)
+        if timed:
+            instrumentation.observe_stage('stt.chunk', time.perf_counter() - start)
+            instrumentation.count('stt.audio_seconds', len(data) / 2 / wf.getframerate())
+        if accepted:
+            instrumentation.count('stt.sentences')
+            yield json.loads(rec.Result())
+        elif tick:
+            yield None
+    yield json.loads(rec.Result())
+
+
+def _is_mono_wave(path):
+    try:
+        with wave.open(path, "rb") as wf:
+            return wf.getnchannels() == 1 and wf.getsampwidth() == 2 and wf.getcomptype() == "NONE"
+    except (wave.Error, EOFError) as e:
+        return False
+
+
+def _open_mono_wave(path, frequency=16000, ffmpeg_path=None):
+    if _is_mono_wave(path):
+        return wave.open(path, "rb")
+    # other formats are converted in memory, batch jobs must not write next to their inputs
+    if ffmpeg_path:
+        return PcmReader(decode_ffmpeg(ffmpeg_path, path, frequency), frequency)
+    from pydub import AudioSegment
+    sound = AudioSegment.from_file(path).set_channels(1).set_frame_rate(frequency).set_sample_width(2)
+    buffer = io.BytesIO()
+    sound.export(buffer, format="wav")
+    buffer.seek(0)
+    return wave.open(buffer, "rb")
+
+
+# one text to speech engine per thread (and per render worker process), pyttsx3.init() is costly
+_tts = threading.local()
+
+
+def _tts_engine():
+    import pyttsx3
+    if getattr(_tts, 'engine', None) is None:
+        _tts.engine = pyttsx3.init()
+    return _tts.engine
+
+
+def _render_speech(text, path):
+    engine = _tts_engine()
+    engine.save_to_file(text, path)
+    engine.runAndWait()
+    return path
+
+
+def _split_paragraphs(texts):
+    return [paragraph.strip() for text in texts for paragraph in text.split("\n\n") if paragraph.strip()]
+
+
+def read_pcm_chunks(path, chunk_frames=4000, realtime=False):
+    # 16 bit mono chunks of a wav file, optionally paced like a live source
+    with _open_mono_wave(path) as wf:
+        chunk_seconds = chunk_frames / wf.getframerate()
+        while True:
+            start = time.monotonic()
+            data = wf.readframes(chunk_frames)
+            if len(data) == 0:
+                break
+            yield data
+            if realtime:
+                time.sleep(max(0.0, chunk_seconds - (time.monotonic() - start)))
+
+
+async def _as_async_iterator(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _final_event(rec_dict, task_function=None):
+    words = rec_dict.get('result', [])
+    event = {'type': 'final', 'text': rec_dict['text'], 'result': words,
+             'start': words[0]['start'] if words else None, 'end': words[-1]['end'] if words else None}
+    if task_function:
+        event['task'] = task_function(rec_dict)
+    return event
 
 
 class Audio(ModelLoader):
     def __init__(self, tasks, model_path):
+        self._reset_audio_state()
+        self.beep_wf = None
+        self.use_transcript_cache = True
+        self.transcript_cache_folder = None
+        self.stt_workers = 1
+        self.min_chunk_seconds = 30
+        self.vad = False
+        # False reads a mono wav into memory instead of mapping it, e.g. when the file is removed right after load
+        self.memmap_audio = True
+        super(Audio, self).__init__(model_path)
+        # self.tasks = ["sst"]
+
+    def _reset_audio_state(self):
         self.wf = None
         self.wf_pydub = None
         self.wf_pydub_modified = None
         self.rec = None
         self.audio_path = None
         self.url = None
-        super(Audio, self).__init__(model_path)
-        # self.tasks = ["sst"]
+        self.audio_hash = None
+        self.samples = None
+        self.vad_stats = None
+        self.transcripts = {}
 
+    @property
+    def wf_pydub(self):
+        # the pydub segment of the recording, only built when the pydub engine or an export needs it
+        if self._wf_pydub is None and self.audio_path is not None:
+            from pydub import AudioSegment
+            if self.samples is not None:
+                self._wf_pydub = AudioSegment(data=self.samples.tobytes(), sample_width=2,
+                                              frame_rate=self.wf.getframerate(), channels=1)
+            else:
+                self._wf_pydub = AudioSegment.from_wav(self.audio_path)
+        return self._wf_pydub
+
+    @wf_pydub.setter
+    def wf_pydub(self, sound):
+        self._wf_pydub = sound
+
+    @instrumentation.timed('audio.load')
     def _load_audio(self, audio_path=None, save_folder=None):
+        import numpy as np
+        from vosk import KaldiRecognizer
         # Download Audio from YouTube if URL is provided
         if re.match("(http(s)??\:\/\/)?(www\.)?((youtube\.com\/watch\?v=)|(youtu.be\/))([a-zA-Z0-9\-_])+", audio_path):
             filename = self._get_audio_youtube(audio_path, save_folder)
@@ -31,21 +166,250 @@ class Audio(ModelLoader):
             self.audio_path = audio_path
         # elif os.path.exists(os.path.join(os.path.abspath("."), audio_path)):
         #     self.audio_path = os.path.join(os.path.abspath("."), audio_path)
-        # Change format, update audio_path, convert to mono
-        if self.audio_path.endswith(".mp3"):
-            self._check_ffmpeg_download()
-            self._convert_ffmpeg()
-            self.audio_path = self.audio_path[:-4] + ".wav"
-            self._convert_to_mono(self.audio_path)
-        # Load 16KHz audio file
-        self.wf = wave.open(self.audio_path, "rb")
-        self.wf_pydub = AudioSegment.from_wav(self.audio_path)
+        self.audio_hash = file_content_hash(self.audio_path)
+        self.samples, self.wf_pydub = None, None
+        rate = None
+        if _is_mono_wave(self.audio_path) and self.memmap_audio:
+            # mapped from the file, pages are read from disk when the recognizer or an export reaches them
+            with instrumentation.stage('audio.decode', decoder='wave'):
+                self.samples, rate = wav_memmap(self.audio_path)
+        elif _is_mono_wave(self.audio_path):
+            with instrumentation.stage('audio.decode', decoder='wave'), wave.open(self.audio_path, "rb") as wf:
+                rate = wf.getframerate()
+                self.samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2')
+        else:
+            ffmpeg_path = self._get_ffmpeg_path()
+            if ffmpeg_path is None and self.audio_path.endswith(".mp3"):
+                self._check_ffmpeg_download()
+                ffmpeg_path = self._get_ffmpeg_path()
+            if ffmpeg_path:
+                # decode, downmix and resample in a single ffmpeg pass straight into memory, no intermediate files
+                rate = 16000
+                with instrumentation.stage('audio.decode', decoder='ffmpeg'):
+                    self.samples = decode_ffmpeg(ffmpeg_path, self.audio_path, rate)
+        if self.samples is not None:
+            self.wf = PcmReader(self.samples, rate)
+        else:
+            # Change format, update audio_path, convert to mono
+            if self.audio_path.endswith(".mp3"):
+                self._check_ffmpeg_download()
+                self._convert_ffmpeg()
+                self.audio_path = self.audio_path[:-4] + ".wav"
+                self._convert_to_mono(self.audio_path)
+            # Load 16KHz audio file
+            self.wf = wave.open(self.audio_path, "rb")
         if os.name == 'nt':
             os.environ['path'] += ';' + os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources",
                                                      self._get_ffmpeg_folder_name())
         self.rec = KaldiRecognizer(self.ssp, self.wf.getframerate())
         self.rec.SetWords(True)
 
+    def _recognize(self, tick=False):
+        # yields one vosk result dict per recognized sentence, replayed from the transcript cache when possible; the
+        # results are kept in columns in self.transcripts and in the cache
+        key = transcript_key(self.audio_hash, self.model_folders['stt'], "vad" if self.vad else None) \
+            if self.audio_hash else None
+        if key and self.use_transcript_cache:
+            recs = transcript_cache.get(key, self.transcript_cache_folder)
+            instrumentation.count('stt.transcript_cache', result='miss' if recs is None else 'hit')
+            if recs is not None:
+                if self.vad and recs.vad_stats is None:
+                    # cached before the statistics were kept with the transcript
+                    self._detect_speech()
+                    recs.vad_stats = self.vad_stats
+                    transcript_cache.put(key, recs, self.transcript_cache_folder)
+                elif self.vad:
+                    self.vad_stats = dict(recs.vad_stats)
+                self.transcripts[self.audio_path] = recs
+                for rec_dict in recs:
+                    yield rec_dict
+                return
+        recs = self.transcripts[self.audio_path] = TranscriptStore()
+        wf, offset_map = self._vad_reader() if self.vad else (self.wf, None)
+        # a parallel decode returns only once every chunk is done, streaming callers (tick) decode serially
+        if not tick and self.stt_workers > 1 and wf.getnframes() >= 2 * self.min_chunk_seconds * wf.getframerate():
+            for rec_dict in self._decode_parallel(self.stt_workers, wf):
+                if offset_map:
+                    restore_rec_times(rec_dict, offset_map, wf.getframerate())
+                recs.append(rec_dict)
+                yield rec_dict
+        else:
+            wf.rewind()
+            for rec_dict in _decode_wave(wf, self.rec, tick=tick):
+                if rec_dict is not None:
+                    if offset_map:
+                        restore_rec_times(rec_dict, offset_map, wf.getframerate())
+                    recs.append(rec_dict)
+                yield rec_dict
+        if self.vad:
+            recs.vad_stats = self.vad_stats
+        if key and self.use_transcript_cache:
+            transcript_cache.put(key, recs, self.transcript_cache_folder)
+
+    @instrumentation.timed('stt.vad')
+    def _detect_speech(self):
+        samples, rate = self._read_samples(), self.wf.getframerate()
+        regions = speech_regions(samples, rate)
+        speech = sum(end - start for start, end in regions)
+        self.vad_stats = {'audio_seconds': len(samples) / rate, 'speech_seconds': speech / rate,
+                          'skipped_seconds': (len(samples) - speech) / rate,
+                          'skipped_ratio': 1 - speech / len(samples) if len(samples) else 0.0,
+                          'regions': len(regions)}
+        print("Voice activity detection skips {:.1f} of {:.1f} s of audio.".format(self.vad_stats['skipped_seconds'],
+                                                                                self.vad_stats['audio_seconds']))
+        return samples, rate, regions
+
+    def _vad_reader(self):
+        # a reader over the speech regions only and the offset map back to the recording, None when nothing is cut
+        samples, rate, regions = self._detect_speech()
+        instrumentation.count('stt.vad_skipped_seconds', self.vad_stats['skipped_seconds'])
+        if regions == [(0, len(samples))]:
+            return self.wf, None
+        compressed, offset_map = compress_regions(samples, regions, rate)
+        return PcmReader(compressed, rate), offset_map
+
+    def _read_samples(self):
+        import numpy as np
+        if self.samples is not None:
+            return self.samples
+        self.wf.rewind()
+        samples = np.frombuffer(self.wf.readframes(self.wf.getnframes()), dtype='<i2')
+        self.wf.rewind()
+        return samples
+
+    def _decode_chunk(self, samples, offset, block_frames=4000):
+        from vosk import KaldiRecognizer
+        rate = self.wf.getframerate()
+        rec = KaldiRecognizer(self.ssp, rate)
+        rec.SetWords(True)
+        recs = []
+        with instrumentation.stage('stt.parallel_chunk'):
+            for first in range(0, len(samples), block_frames):
+                if rec.AcceptWaveform(samples[first:first + block_frames].tobytes()):
+                    recs.append(json.loads(rec.Result()))
+            recs.append(json.loads(rec.Result()))
+        instrumentation.count('stt.audio_seconds', len(samples) / rate)
+        instrumentation.count('stt.sentences', len(recs) - 1)
+        return [shift_rec_times(rec_dict, offset / rate) for rec_dict in recs]
+
+    @instrumentation.timed('stt.parallel_decode')
+    def _decode_parallel(self, workers, wf=None):
+        # cut at pauses, decode the chunks on separate recognizers and shift word times back to the full recording
+        samples = wf.samples if isinstance(wf, PcmReader) else self._read_samples()
+        rate = self.wf.getframerate()
+        n_chunks = min(workers, int(len(samples) / rate // self.min_chunk_seconds))
+        points = split_points(samples, rate, n_chunks)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunk_recs = list(executor.map(lambda i: self._decode_chunk(samples[points[i]:points[i + 1]], points[i]),
+                                           range(len(points) - 1)))
+        # every chunk ends with a flushed, often empty, result; only the last one belongs to the transcript
+        recs = [rec_dict for recs in chunk_recs[:-1] for rec_dict in recs if rec_dict['text']]
+        return recs + chunk_recs[-1]
+
+    @instrumentation.timed('stt.transcribe_file')
+    def _transcribe_file(self, path):
+        from vosk import KaldiRecognizer
+        key = transcript_key(file_content_hash(path), self.model_folders['stt'])
+        recs = transcript_cache.get(key, self.transcript_cache_folder) if self.use_transcript_cache else None
+        if recs is None:
+            wf = _open_mono_wave(path, ffmpeg_path=self._get_ffmpeg_path())
+            try:
+                rec = KaldiRecognizer(self.ssp, wf.getframerate())
+                rec.SetWords(True)
+                recs = TranscriptStore(_decode_wave(wf, rec))
+            finally:
+                wf.close()
+            if self.use_transcript_cache:
+                transcript_cache.put(key, recs, self.transcript_cache_folder)
+        return list(recs)
+
+    def _transcribe_task(self, index, path):
+        try:
+            recs = self._transcribe_file(path)
+            return {'id': index, 'path': path, 'text': [rec_dict['text'] for rec_dict in recs], 'result': recs,
+                    'error': None}
+        except Exception as e:
+            # one unreadable file must not stop the batch
+            return {'id': index, 'path': path, 'text': [], 'result': [], 'error': repr(e)}
+
+    def transcribe_many(self, paths, workers=4, max_pending=None, ordered=False):
+        # all workers share the loaded vosk model, each file gets its own KaldiRecognizer
+        max_pending = max_pending or 2 * workers
+        path_iter = iter(enumerate(paths))
+        futures, finished, next_id = set(), {}, 0
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                # submit only while in flight plus buffered results stay under max_pending
+                while not exhausted and len(futures) + len(finished) < max_pending:
+                    try:
+                        index, path = next(path_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    futures.add(executor.submit(self._transcribe_task, index, path))
+                if not futures:
+                    break
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    transcript = future.result()
+                    if not ordered:
+                        yield transcript
+                    else:
+                        finished[transcript['id']] = transcript
+                while next_id in finished:
+                    yield finished.pop(next_id)
+                    next_id += 1
+
+    def _new_recognizer(self, sample_rate):
+        from vosk import KaldiRecognizer
+        rec = KaldiRecognizer(self.ssp, sample_rate)
+        rec.SetWords(True)
+        return rec
+
+    def recognize_stream(self, chunks, sample_rate=16000, partial=True, task_function=None):
+        # chunks is any iterable of 16 bit mono PCM bytes, events are yielded while the audio arrives
+        rec = self._new_recognizer(sample_rate)
+        last_partial = ""
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if rec.AcceptWaveform(bytes(chunk)):
+                last_partial = ""
+                yield _final_event(json.loads(rec.Result()), task_function)
+            elif partial:
+                text = json.loads(rec.PartialResult()).get('partial', "")
+                if text and text != last_partial:
+                    last_partial = text
+                    yield {'type': 'partial', 'text': text}
+        rec_dict = json.loads(rec.FinalResult())
+        if rec_dict.get('text'):
+            yield _final_event(rec_dict, task_function)
+
+    async def arecognize_stream(self, chunks, sample_rate=16000, partial=True, task_function=None, executor=None):
+        # same events as recognize_stream for async (or plain) iterables, decoding runs off the event loop
+        loop = asyncio.get_running_loop()
+        rec = self._new_recognizer(sample_rate)
+        last_partial = ""
+        if not hasattr(chunks, '__aiter__'):
+            chunks = _as_async_iterator(chunks)
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if await loop.run_in_executor(executor, rec.AcceptWaveform, bytes(chunk)):
+                last_partial = ""
+                rec_dict = json.loads(rec.Result())
+                yield await loop.run_in_executor(executor, _final_event, rec_dict, task_function)
+            elif partial:
+                text = json.loads(rec.PartialResult()).get('partial', "")
+                if text and text != last_partial:
+                    last_partial = text
+                    yield {'type': 'partial', 'text': text}
+        rec_dict = json.loads(await loop.run_in_executor(executor, rec.FinalResult))
+        if rec_dict.get('text'):
+            yield await loop.run_in_executor(executor, _final_event, rec_dict, task_function)
+
+    @instrumentation.timed('audio.convert')
     def _convert_ffmpeg(self):
         # example
         # ffmpeg-2022-02-24-git-8ef03c2ff1-full_build\\bin\\ffmpeg -i test.mp3 test.wav -y
@@ -65,6 +429,7 @@ class Audio(ModelLoader):
             print("File converted to wav using FFMPEG.")
 
     def _convert_to_mono(self, file_path=None, frequency=16000):
+        from pydub import AudioSegment
         # try:
         if file_path is None:
             sound = self.wf_pydub
@@ -81,10 +446,11 @@ class Audio(ModelLoader):
         #     print(e)
 
     def _enlarge_window(self, aud_dict, window_gap=0.1):
-        return (int(np.floor((aud_dict['start'] - window_gap) * 1000)), int(
-            np.ceil((aud_dict['end'] + window_gap) * 1000)))
+        return (int(math.floor((aud_dict['start'] - window_gap) * 1000)), int(
+            math.ceil((aud_dict['end'] + window_gap) * 1000)))
 
     def _get_audio_youtube(self, video_url, save_folder=None):
+        import youtube_dl
         video_info = youtube_dl.YoutubeDL().extract_info(
             url=video_url, download=False
         )
@@ -106,18 +472,45 @@ class Audio(ModelLoader):
         return filename
 
     # create a copy of audio file and manipulate
+    @instrumentation.timed('audio.mute')
     def _mute_wf(self, unmute_span):
+        if self.beep_wf is None:
+            from pydub import AudioSegment
+            self.beep_wf = AudioSegment.from_wav(os.path.join(os.path.dirname(__file__), "resources", "beep.wav"))
         new_wf = unmute_span[0]
         for audio in unmute_span[1:]:
             new_wf = new_wf + self.beep_wf + audio
         return new_wf
 
+    @instrumentation.timed('tts.speak')
     def _speak(self, text):
-        engine = pyttsx3.init()
+        engine = _tts_engine()
         engine.say(text)
         engine.runAndWait()
         return
 
+    @instrumentation.timed('tts.render')
+    def _render_sentences(self, texts, workers=None, frequency=16000):
+        # paragraphs are synthesized to files by a pool of processes, each with its own engine, and stitched in order
+        from pydub import AudioSegment
+        paragraphs = _split_paragraphs(texts)
+        render_folder = tempfile.mkdtemp(prefix="multimodal-tts-")
+        try:
+            paths = [os.path.join(render_folder, str(i) + ".wav") for i in range(len(paragraphs))]
+            if workers == 1 or len(paragraphs) <= 1:
+                rendered = [_render_speech(paragraph, path) for paragraph, path in zip(paragraphs, paths)]
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_tts_engine) as executor:
+                    rendered = list(executor.map(_render_speech, paragraphs, paths))
+            chunks = []
+            for path in rendered:
+                sound = AudioSegment.from_file(path).set_channels(1).set_frame_rate(frequency).set_sample_width(2)
+                chunks.append(sound.raw_data)
+            # a single join instead of adding segments one by one
+            return AudioSegment(data=b"".join(chunks), sample_width=2, frame_rate=frequency, channels=1)
+        finally:
+            shutil.rmtree(render_folder, ignore_errors=True)
+
     # def _export_speak(self, speak_text, audio_path=None):
     #     if audio_path:
     #         engine = pyttsx3.init()
@@ -132,12 +525,47 @@ class Audio(ModelLoader):
     #         engine.save_to_file(speak_text, os.path.join(new_audio_path, new_filename))
     #         engine.runAndWait()
 
-    def _export_pydub(self, audio_path=None):
-        if audio_path:
-            self.wf_pydub_modified[self.audio_path].export(audio_path, format="wav")
-        else:
-            new_filename = self.audio_path.split(os.sep)[-1]
-            new_audio_path = self.audio_path[:-len(new_filename)]
-            ext = new_filename.split(".")[-1]
-            new_filename = new_filename[:-len(ext) - 1] + "_modified." + ext
-            self.wf_pydub_modified[self.audio_path].export(os.path.join(new_audio_path, new_filename), format="wav")
+    def _export_path(self, source_path, suffix):
+        new_filename = source_path.split(os.sep)[-1]
+        new_audio_path = source_path[:-len(new_filename)]
+        ext = new_filename.split(".")[-1]
+        new_filename = new_filename[:-len(ext) - 1] + suffix + ".wav"
+        return os.path.join(new_audio_path, new_filename)
+
+    @instrumentation.timed('export')
+    def _export_pydub(self, audio_path=None, source_path=None, suffix="_modified"):
+        source_path = source_path or self.audio_path
+        with replacing(audio_path or self._export_path(source_path, suffix)) as tmp_path:
+            self.wf_pydub_modified[source_path].export(tmp_path, format="wav").close()
+
+    def _mute_source(self, memmap=False):
+        # samples of the loaded recording, mapped from the wav file instead of held in memory with memmap=True
+        if memmap and _is_mono_wave(self.audio_path):
+            return wav_memmap(self.audio_path)
+        return self._read_samples(), self.wf.getframerate()
+
+    def _beep_pattern(self, rate):
+        import numpy as np
+        with wave.open(os.path.join(os.path.dirname(__file__), "resources", "beep.wav"), "rb") as wf:
+            beep = np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2')
+            beep_rate = wf.getframerate()
+        if beep_rate == rate:
+            return beep
+        positions = np.arange(int(len(beep) * rate / beep_rate)) * beep_rate / rate
+        return np.interp(positions, np.arange(len(beep)), beep).astype('<i2')
+
+    def _muted_samples(self, intervals, fill='beep', memmap=False):
+        # a filled copy of the whole recording, only needed when the audio is returned
+        import numpy as np
+        samples, rate = self._mute_source(memmap)
+        pattern = self._beep_pattern(rate) if fill == 'beep' else None
+        return apply_fill(np.array(samples, dtype='<i2'), intervals, pattern), rate
+
+    @instrumentation.timed('export', engine='numpy')
+    def _export_muted(self, audio_path=None, source_path=None, suffix="_modified"):
+        # streams the recording to the wav file block by block, muted intervals replaced on the way
+        source_path = source_path or self.audio_path
+        intervals, fill, memmap = self.mute_intervals[source_path]
+        samples, rate = self._mute_source(memmap)
+        write_filled_wav(audio_path or self._export_path(source_path, suffix), samples, rate, intervals,
+                         self._beep_pattern(rate) if fill == 'beep' else None)
@@ -0,0 +1,174 @@
+import os
+import time
+from collections import OrderedDict
+from .model_registry import estimate_model_size
+
+# fp32: plain PyTorch, int8: PyTorch dynamic quantization of the Linear layers, onnx: exported model on onnxruntime
+BACKENDS = ('fp32', 'int8', 'onnx')
+TORCH_MODEL_CLASSES = {'ner': 'AutoModelForTokenClassification',
+                       'sentiment-analysis': 'AutoModelForSequenceClassification',
+                       'question-answering': 'AutoModelForQuestionAnswering',
+                       'text-generation': 'AutoModelForCausalLM'}
+ORT_MODEL_CLASSES = {'ner': 'ORTModelForTokenClassification',
+                     'sentiment-analysis': 'ORTModelForSequenceClassification',
+                     'question-answering': 'ORTModelForQuestionAnswering',
+                     'text-generation': 'ORTModelForCausalLM'}
+
+
+def backend_folder(folder, backend):
+    # converted models are cached next to the downloaded fp32 folder
+    return folder if backend == 'fp32' else folder.rstrip(os.sep) + "-" + backend
+
+
+def _load_torch_model(task, folder, weights=True):
+    import transformers
+    model_class = getattr(transformers, TORCH_MODEL_CLASSES[task])
+    if weights:
+        return model_class.from_pretrained(folder)
+    return model_class.from_config(transformers.AutoConfig.from_pretrained(folder))
+
+
+def _quantize(model):
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8).eval()
+
+
+def _plain_state(state_dict):
+    # quantized tensors and dtypes are stored as plain tensors and strings, pickling them by name looks them up in
+    # every imported module and trips over lazily importing ones
+    import torch
+    plain = {}
+    for name, value in state_dict.items():
+        if isinstance(value, torch.dtype):
+            value = ('dtype', str(value).split(".")[-1])
+        elif isinstance(value, torch.Tensor) and value.is_quantized:
+            value = ('qtensor', value.int_repr(), value.q_scale(), value.q_zero_point())
+        elif isinstance(value, tuple):
+            value = ('tuple',) + tuple(_plain_state({i: v for i, v in enumerate(value)}).values())
+        plain[name] = value
+    return plain
+
+
+def _quantized_state(plain):
+    import torch
+    state_dict = {}
+    for name, value in plain.items():
+        if isinstance(value, tuple) and value[0] == 'dtype':
+            value = getattr(torch, value[1])
+        elif isinstance(value, tuple) and value[0] == 'qtensor':
+            value = torch._make_per_tensor_quantized_tensor(value[1], value[2], value[3])
+        elif isinstance(value, tuple) and value[0] == 'tuple':
+            value = tuple(_quantized_state(dict(enumerate(value[1:]))).values())
+        state_dict[name] = value
+    return state_dict
+
+
+def _load_int8_model(task, folder):
+    # the quantized weights are cached, later loads quantize an empty model built from the config and fill it
+    import torch
+    cached_path = os.path.join(backend_folder(folder, 'int8'), "quantized_state_dict.pt")
+    if os.path.isfile(cached_path):
+        model = _quantize(_load_torch_model(task, folder, weights=False))
+        cached = torch.load(cached_path)
+        state_dict = OrderedDict(_quantized_state(cached['state']))
+        # the module versions tell the quantized layers how their entries are laid out
+        state_dict._metadata = cached['metadata']
+        model.load_state_dict(state_dict)
+        return model
+    model = _quantize(_load_torch_model(task, folder))
+    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+    state_dict = model.state_dict()
+    torch.save({'state': _plain_state(state_dict), 'metadata': dict(state_dict._metadata)}, cached_path + ".tmp")
+    os.replace(cached_path + ".tmp", cached_path)
+    return model
+
+
+def _load_onnx_model(task, folder):
+    try:
+        import optimum.onnxruntime
+    except ImportError:
+        raise ImportError("The onnx backend needs optimum and onnxruntime: pip install optimum[onnxruntime]")
+    model_class = getattr(optimum.onnxruntime, ORT_MODEL_CLASSES[task])
+    onnx_folder = backend_folder(folder, 'onnx')
+    if os.path.isdir(onnx_folder):
+        return model_class.from_pretrained(onnx_folder)
+    model = model_class.from_pretrained(folder, export=True)
+    model.save_pretrained(onnx_folder)
+    return model
+
+
+def load_model(task, folder, backend='fp32'):
+    if backend == 'fp32':
+        return _load_torch_model(task, folder)
+    elif backend == 'int8':
+        return _load_int8_model(task, folder)
+    elif backend == 'onnx':
+        return _load_onnx_model(task, folder)
+    raise ValueError("Unknown backend " + repr(backend) + ", valid backends: " + str(list(BACKENDS)))
+
+
+def build_pipeline(task, folder, backend='fp32', device=-1):
+    from transformers import AutoTokenizer, pipeline
+    if backend != 'fp32' and device != -1:
+        print("The " + backend + " backend runs on CPU only.")
+        device = -1
+    tokenizer = AutoTokenizer.from_pretrained(folder)
+    return pipeline(task, model=load_model(task, folder, backend), tokenizer=tokenizer, device=device)
+
+
+def _rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError) as e:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _comparable(task, output):
+    # the part of a pipeline output that has to match the fp32 baseline
+    if task == 'ner':
+        return [(entity['word'], entity['entity']) for entity in output]
+    elif task == 'sentiment-analysis':
+        return (output[0] if isinstance(output, list) else output)['label']
+    elif task == 'question-answering':
+        return output['answer'].strip()
+    return output[0]['generated_text']
+
+
+def _run(task, nlp, sample):
+    if task == 'question-answering':
+        return nlp(**sample)
+    elif task == 'text-generation':
+        return nlp(sample, max_new_tokens=20, do_sample=False)
+    return nlp(sample)
+
+
+def compare_backends(task, folder, samples, backends=BACKENDS, repeats=3):
+    # latency, memory and agreement with fp32 for each backend, questions answering samples are
+    # {'question': ..., 'context': ...} dicts, the other tasks take strings
+    reports, baseline = [], None
+    for backend in ('fp32',) + tuple(b for b in backends if b != 'fp32'):
+        rss_before = _rss()
+        start = time.perf_counter()
+        try:
+            nlp = build_pipeline(task, folder, backend)
+        except ImportError as e:
+            reports.append({'backend': backend, 'error': str(e)})
+            continue
+        load_seconds = time.perf_counter() - start
+        rss_delta = _rss() - rss_before
+        outputs = [_comparable(task, _run(task, nlp, sample)) for sample in samples]
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for sample in samples:
+                _run(task, nlp, sample)
+        latency = (time.perf_counter() - start) / (repeats * len(samples))
+        if baseline is None:
+            baseline = outputs
+        reports.append({'backend': backend, 'load_seconds': load_seconds, 'latency_seconds': latency,
+                        'rss_delta_bytes': rss_delta,
+                        'model_bytes': estimate_model_size(nlp, backend_folder(folder, backend)),
+                        'agreement': sum(a == b for a, b in zip(outputs, baseline)) / len(samples)})
+        nlp = None
+    return reports
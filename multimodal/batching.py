@@ -0,0 +1,128 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from .instrumentation import instrumentation
+
+
+def length_buckets(inputs, batch_size, length=len):
+    # indices of inputs grouped into batches of similar length, so padding inside a batch stays small
+    order = sorted(range(len(inputs)), key=lambda i: length(inputs[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _token_count(nlp, item):
+    tokenizer = getattr(nlp, 'tokenizer', None)
+    if tokenizer is None:
+        return 0
+    if isinstance(item, dict):
+        return len(tokenizer(item['question'], item['context'])['input_ids'])
+    return len(tokenizer(item)['input_ids'])
+
+
+def _observe_batch(nlp, batch):
+    # tokenizing again costs about as much as the pipeline's own tokenization, only done while instrumented
+    task = getattr(nlp, 'task', 'nlp')
+    instrumentation.observe('nlp.batch_size', len(batch), task=task)
+    instrumentation.observe('nlp.batch_tokens', sum(_token_count(nlp, item) for item in batch), task=task)
+    instrumentation.count('nlp.inputs', len(batch), task=task)
+
+
+def run_batched(nlp, inputs, batch_size=16, length=len, empty_result=None, **kwargs):
+    # run a transformers pipeline over length bucketed batches and return the outputs in input order
+    outputs = [empty_result] * len(inputs)
+    non_empty = [i for i in range(len(inputs)) if inputs[i]]
+    for bucket in length_buckets([inputs[i] for i in non_empty], batch_size, length):
+        batch = [inputs[non_empty[i]] for i in bucket]
+        if instrumentation.enabled:
+            _observe_batch(nlp, batch)
+        with instrumentation.stage('nlp.batch', task=getattr(nlp, 'task', 'nlp')):
+            if len(batch) == 1:
+                batch_outputs = [nlp(batch[0], **kwargs)]
+            else:
+                batch_outputs = nlp(batch, batch_size=len(batch), **kwargs)
+        for i, output in zip(bucket, batch_outputs):
+            outputs[non_empty[i]] = output
+    return outputs
+
+
+class BatchQueue:
+    # coalesces items submitted from many threads into batched calls of batch_function, a batch is closed when it
+    # reaches max_batch_size or max_wait seconds after its first item
+    def __init__(self, batch_function, max_batch_size=16, max_wait=0.01, name=None, latency_window=1000):
+        self.batch_function = batch_function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.requests, self.batches, self.errors = 0, 0, 0
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, name="batch-" + str(name), daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def map(self, items, timeout=None):
+        futures = [self.submit(item) for item in items]
+        return [future.result(timeout) for future in futures]
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._running = False
+                break
+            batch.append(entry)
+        return batch
+
+    def _worker(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                break
+            try:
+                results = self.batch_function([item for item, _, _ in batch])
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._lock:
+                    self.errors += 1
+            finished = time.monotonic()
+            with self._lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self._latencies.extend(finished - submitted for _, _, submitted in batch)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+            return {'queue_depth': self._queue.qsize(), 'requests': self.requests, 'batches': self.batches,
+                    'errors': self.errors, 'mean_batch_size': self.requests / self.batches if self.batches else None,
+                    'latency_p50': percentile(0.5), 'latency_p95': percentile(0.95),
+                    'latency_max': latencies[-1] if latencies else None}
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,77 @@
+from .instrumentation import instrumentation
+
+SENTENCE_END = (".", "!", "?", "\n")
+
+
+class SentenceGenerator:
+    # continues a prompt sentence by sentence, feeding only the new token per step and reusing past key/values
+    def __init__(self, model, tokenizer, top_k=50, temperature=1.0, do_sample=True, max_sentence_tokens=80,
+                 min_sentence_tokens=3, max_context=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.top_k = top_k
+        self.temperature = temperature
+        self.do_sample = do_sample
+        self.max_sentence_tokens = max_sentence_tokens
+        self.min_sentence_tokens = min_sentence_tokens
+        self.max_context = max_context or getattr(model.config, 'n_positions', 1024)
+        self.eos_token_id = tokenizer.eos_token_id
+
+    def _forward(self, input_ids, past):
+        import torch
+        input_ids = torch.tensor([input_ids], device=self.model.device)
+        with torch.no_grad():
+            output = self.model(input_ids=input_ids, past_key_values=past, use_cache=True)
+        return output.logits[0, -1], output.past_key_values
+
+    def _next_token(self, logits):
+        import torch
+        if not self.do_sample:
+            return int(torch.argmax(logits))
+        values, indices = torch.topk(logits, min(self.top_k, logits.shape[-1]))
+        probs = torch.softmax(values / self.temperature, dim=-1)
+        return int(indices[torch.multinomial(probs, 1)])
+
+    def _is_sentence_end(self, token_id, n_tokens):
+        if token_id == self.eos_token_id:
+            return True
+        piece = self.tokenizer.decode([token_id]).rstrip(" \"')]")
+        return n_tokens >= self.min_sentence_tokens and piece.endswith(SENTENCE_END)
+
+    def sentences(self, prompt_text, n_sentences=1):
+        # generation ends at the end of text token; empty sentences are skipped without counting, within a budget of
+        # max_sentence_tokens per requested sentence
+        history = self.tokenizer.encode(prompt_text)[-(self.max_context // 2):]
+        if not history:
+            # nothing to condition on, start from the beginning of text token as gpt-2 does
+            bos_token_id = self.tokenizer.bos_token_id
+            history = [self.eos_token_id if bos_token_id is None else bos_token_id]
+        logits, past = self._forward(history, None)
+        n_past = len(history)
+        n_yielded, budget = 0, n_sentences * self.max_sentence_tokens
+        while n_yielded < n_sentences and budget > 0:
+            tokens = []
+            while True:
+                token_id = self._next_token(logits)
+                tokens.append(token_id)
+                if token_id == self.eos_token_id:
+                    break
+                history.append(token_id)
+                if n_past + 1 > self.max_context:
+                    # context window is full, restart the cache from the most recent half of the history
+                    history = history[-(self.max_context // 2):]
+                    logits, past = self._forward(history, None)
+                    n_past = len(history)
+                else:
+                    logits, past = self._forward([token_id], past)
+                    n_past += 1
+                if self._is_sentence_end(token_id, len(tokens)) or len(tokens) >= self.max_sentence_tokens:
+                    break
+            instrumentation.count('nlp.generated_tokens', len(tokens))
+            budget -= len(tokens)
+            sentence = self.tokenizer.decode([t for t in tokens if t != self.eos_token_id])
+            if sentence.strip():
+                n_yielded += 1
+                yield sentence
+            if tokens[-1] == self.eos_token_id:
+                return
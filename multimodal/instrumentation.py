@@ -0,0 +1,220 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+class _NullStage:
+    # returned by stage() while disabled, entering and leaving it does nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, instrumentation, name, labels):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *args):
+        labels = dict(self.labels, error=exc_type.__name__) if exc_type else self.labels
+        self.instrumentation.observe_stage(self.name, time.perf_counter() - self.start, **labels)
+        return False
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count, self.sum = 0, 0.0
+        self.min, self.max = None, None
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def as_dict(self):
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            total += count
+            cumulative[bound] = total
+        return {'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+                'mean': self.sum / self.count if self.count else None, 'buckets': cumulative}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _prometheus_name(name):
+    return "multimodal_" + re.sub("[^a-zA-Z0-9_]", "_", name)
+
+
+def _prometheus_labels(labels, extra=()):
+    pairs = [(k, v) for k, v in labels] + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for k, v in pairs) + "}"
+
+
+class Instrumentation:
+    # stage timers, counters and histograms of the whole package. While disabled every call returns right after
+    # one attribute check, so the call sites stay in place. MULTIMODAL_INSTRUMENTATION=1 enables it at import.
+    def __init__(self, enabled=None):
+        if enabled is None:
+            enabled = os.environ.get("MULTIMODAL_INSTRUMENTATION", "") not in ("", "0")
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._counters, self._histograms, self._stages = {}, {}, {}
+            self.started = time.time()
+
+    def add_callback(self, callback):
+        # callback(event) is called for every stage, counter and histogram event, event is a dict with type,
+        # name, value and labels. It runs on the thread that recorded the event.
+        with self._lock:
+            self._callbacks = self._callbacks + [callback]
+        return callback
+
+    def remove_callback(self, callback):
+        with self._lock:
+            self._callbacks = [c for c in self._callbacks if c is not callback]
+
+    def _notify(self, event_type, name, value, labels):
+        for callback in self._callbacks:
+            callback({'type': event_type, 'name': name, 'value': value, 'labels': labels})
+
+    def stage(self, name, **labels):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, labels)
+
+    def observe_stage(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = _key(name, labels)
+            if key not in self._stages:
+                self._stages[key] = _Histogram(SECONDS_BUCKETS)
+            self._stages[key].add(seconds)
+        if self._callbacks:
+            self._notify('stage', name, seconds, labels)
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = _key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self._callbacks:
+            self._notify('counter', name, value, labels)
+
+    def observe(self, name, value, buckets=SIZE_BUCKETS, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            key = _key(name, labels)
+            if key not in self._histograms:
+                self._histograms[key] = _Histogram(buckets)
+            self._histograms[key].add(value)
+        if self._callbacks:
+            self._notify('histogram', name, value, labels)
+
+    def timed(self, name, **labels):
+        # decorator form of stage()
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def recording(self, reset=True):
+        # enables the instrumentation for the block, e.g. to profile one call
+        enabled = self.enabled
+        if reset:
+            self.reset()
+        self.enable()
+        try:
+            yield self
+        finally:
+            self.enabled = enabled
+
+    def snapshot(self):
+        with self._lock:
+            entries = lambda d, f: [dict(name=name, labels=dict(labels), **f(value))
+                                    for (name, labels), value in sorted(d.items(), key=lambda item: str(item[0]))]
+            return {'started': self.started, 'time': time.time(),
+                    'stages': entries(self._stages, lambda h: h.as_dict()),
+                    'counters': entries(self._counters, lambda v: {'value': v}),
+                    'histograms': entries(self._histograms, lambda h: h.as_dict())}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self):
+        with self._lock:
+            lines = []
+            histograms = [(_prometheus_name("stage_seconds"), [(labels + (('stage', name),), h)
+                                                              for (name, labels), h in self._stages.items()])]
+            names = sorted(set(name for name, _ in self._histograms))
+            histograms += [(_prometheus_name(name), [(labels, h) for (n, labels), h in self._histograms.items()
+                                                     if n == name]) for name in names]
+            for metric, series in histograms:
+                if not series:
+                    continue
+                lines.append("# TYPE " + metric + " histogram")
+                for labels, h in sorted(series, key=lambda s: s[0]):
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.bucket_counts):
+                        cumulative += count
+                        lines.append(metric + "_bucket" + _prometheus_labels(labels, [('le', bound)]) + " " +
+                                     str(cumulative))
+                    lines.append(metric + "_bucket" + _prometheus_labels(labels, [('le', "+Inf")]) + " " +
+                                 str(h.count))
+                    lines.append(metric + "_sum" + _prometheus_labels(labels) + " " + repr(h.sum))
+                    lines.append(metric + "_count" + _prometheus_labels(labels) + " " + str(h.count))
+            for name in sorted(set(name for name, _ in self._counters)):
+                metric = _prometheus_name(name) + "_total"
+                lines.append("# TYPE " + metric + " counter")
+                for (n, labels), value in sorted(self._counters.items()):
+                    if n == name:
+                        lines.append(metric + _prometheus_labels(labels) + " " + str(value))
+            return "\n".join(lines) + "\n"
+
+
+instrumentation = Instrumentation()
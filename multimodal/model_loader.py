@@ -1,19 +1,31 @@
+import csv
 import os
+import shutil
 import subprocess
-import zipfile
-import pandas as pd
-import torch.cuda
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline, AutoModelForSequenceClassification, \
-    AutoModelForQuestionAnswering, AutoModelForCausalLM
-from vosk import Model
-import gdown
+import weakref
+from .backends import backend_folder, build_pipeline
+from .model_registry import registry, _release_keys
+from .provisioning import provision
+
+
+def _read_file_info():
+    with open(os.path.join(os.path.dirname(__file__), "file_info.csv"), newline='') as f:
+        return {row['task']: row for row in csv.DictReader(f)}
 
 
 class ModelLoader:
     def __init__(self, model_path):
         # if model_path and model_path != "":
         self.model_path = model_path
-        self.file_df = pd.read_csv(os.path.join(os.path.dirname(__file__), "file_info.csv"))
+        if not hasattr(self, '_registry_keys'):
+            # keys of the shared models held by this instance, released when the instance is collected
+            self._registry_keys = []
+            weakref.finalize(self, _release_keys, self._registry_keys)
+        self.file_info = _read_file_info()
+        if not hasattr(self, 'backends'):
+            self.backends = {}
+        # every loaded transformers pipeline by mode, self.nlp is the last one loaded
+        self.nlps = {}
         self.model_dict = {'ner': self.ner_load_model, 'stt': self.vosk_load_model,
                            'sentiment-analysis': self.sent_load_model,
                            'question-answering': self.qa_load_model,
@@ -21,121 +33,60 @@ class ModelLoader:
         # self.tasks = []
 
     def _get_file_info(self, task, column):
-        return self.file_df[self.file_df[:]['task'] == task][column].values[0]
+        return self.file_info[task][column]
 
     def _download_load_models(self):
         self.model_folders = {task: os.path.join(self.model_path, self._get_file_info(task, 'folder')) for task in
-                              self.tasks if task in self.file_df[:]['task'].values}
-        self.model_urls = {task: self._get_file_info(task, 'url') for task in self.tasks if
-                           task in self.file_df[:]['task'].values}
+                              self.tasks if task in self.file_info}
+        self.model_urls = {task: self._get_file_info(task, 'url') for task in self.tasks if task in self.file_info}
+        # missing models of all tasks are downloaded together before any of them is loaded
+        provision(self.file_info, self.tasks, self.model_path)
         for task in self.tasks:
-            if task in self.file_df[:]['task'].values:
+            if task in self.file_info:
                 self.model_dict[task]()
 
     def tg_load_model(self):
-        if os.path.isdir(self.model_folders['text-generation']):
-            self._load_transformers_model('text-generation')
-        else:
-            self._download_transformers_model('text-generation')
-            self._load_transformers_model('text-generation')
+        self._load_transformers_model('text-generation')
 
     def qa_load_model(self):
-        if os.path.isdir(self.model_folders['question-answering']):
-            self._load_transformers_model('question-answering')
-        else:
-            self._download_transformers_model('question-answering')
-            self._load_transformers_model('question-answering')
+        self._load_transformers_model('question-answering')
 
     def sent_load_model(self):
-        if os.path.isdir(self.model_folders['sentiment-analysis']):
-            self._load_transformers_model('sentiment-analysis')
-        else:
-            self._download_transformers_model('sentiment-analysis')
-            self._load_transformers_model('sentiment-analysis')
+        self._load_transformers_model('sentiment-analysis')
 
     def ner_load_model(self):
-        if os.path.isdir(self.model_folders['ner']):
-            self._load_transformers_model('ner')
-        else:
-            self._download_transformers_model('ner')
-            self._load_transformers_model('ner')
+        self._load_transformers_model('ner')
 
     def _load_transformers_model(self, task):
-        tokenizer = AutoTokenizer.from_pretrained(self.model_folders[task])
-        if task == 'ner':
-            model = AutoModelForTokenClassification.from_pretrained(self.model_folders[task])
-            self.nlp = pipeline(task, model=model, tokenizer=tokenizer, device=0 if torch.cuda.is_available() else -1)
-            #, grouped_entities=True)
-        elif task == 'sentiment-analysis':
-            model = AutoModelForSequenceClassification.from_pretrained(self.model_folders[task])
-            self.nlp = pipeline(task, model=model, tokenizer=tokenizer, device=0 if torch.cuda.is_available() else -1)
-        elif task == 'question-answering':
-            model = AutoModelForQuestionAnswering.from_pretrained(self.model_folders[task])
-            self.nlp = pipeline(task, model=model, tokenizer=tokenizer, device=0 if torch.cuda.is_available() else -1)
-        elif task == 'text-generation':
-            model = AutoModelForCausalLM.from_pretrained(self.model_folders[task])
-            self.nlp = pipeline(task, model=model, tokenizer=tokenizer, device=0 if torch.cuda.is_available() else -1)
-        tokenizer, model = None, None
+        import torch
+        device = 0 if torch.cuda.is_available() else -1
+        backend = self.backends.get(task, 'fp32')
+        if backend != 'fp32':
+            device = -1
+        key = (task, backend_folder(self.model_folders[task], backend), device)
+        self.nlp = registry.acquire(key, lambda: build_pipeline(task, self.model_folders[task], backend, device),
+                                    folder=self.model_folders[task])
+        self.nlps[task] = self.nlp
+        self._registry_keys.append(key)
         return
 
-    def _download_transformers_model(self, task):
-        try:
-            tokenizer = AutoTokenizer.from_pretrained(self.model_urls[task])
-            if task == 'ner':
-                model = AutoModelForTokenClassification.from_pretrained(self.model_urls[task])
-            elif task == 'sentiment-analysis':
-                model = AutoModelForSequenceClassification.from_pretrained(self.model_urls[task])
-            elif task == 'question-answering':
-                model = AutoModelForQuestionAnswering.from_pretrained(self.model_urls[task])
-            elif task == 'text-generation':
-                model = AutoModelForCausalLM.from_pretrained(self.model_urls[task])
-
-            tokenizer.save_pretrained(self.model_folders[task])
-            model.save_pretrained(self.model_folders[task])
-            tokenizer, model = None, None
-
-            # # Install Git - LFS on non windows
-            # if os.name != 'nt':
-            #     p_git_lfs = subprocess.Popen('apt-get install git-lfs ', shell=True, stdout=subprocess.PIPE)
-            #     p_git_lfs.wait()
-            #     p_git_lfs.stdout.readlines()
-            #     print("Git LFS installed.")
-            # git_command = 'git lfs clone ' + self.model_urls[task] + ' "' + self.model_folders[task] + '"'
-            # p_dl_ner = subprocess.Popen(git_command, shell=True, stdout=subprocess.PIPE)
-            # p_dl_ner.wait()
-            # p_dl_ner.stdout.readlines()
-            # print("Transformers NER Model downloaded.")
-            # return
-        except Exception as e:
-            print("NER Model Download failed.")
-
     def vosk_load_model(self):
-        if os.path.isdir(self.model_folders['stt']):
-            self._vosk_load_model()
-        else:
-            self._vosk_download_model()
-            self._vosk_load_model()
+        self._vosk_load_model()
 
     def _vosk_load_model(self):
-        self.ssp = Model(self.model_folders['stt'])
+        from vosk import Model
+        key = ('stt', self.model_folders['stt'], 'cpu')
+        self.ssp = registry.acquire(key, lambda: Model(self.model_folders['stt']), folder=self.model_folders['stt'])
+        self._registry_keys.append(key)
         return
 
-    def _vosk_download_model(self):
-        try:
-            p_dl_vosk = subprocess.Popen(
-                'curl ' + self.model_urls['stt'] + ' --output "' + self.model_folders['stt'] + '.zip"',
-                shell=True, stdout=subprocess.PIPE)
-            p_dl_vosk.wait()
-            gdown.download(self.model_urls['stt'], self.model_folders['stt'] + '.zip', quiet=False)
-            print("VOSK Model Downloaded.")
-            # p_unzip_vosk = subprocess.Popen('unzip vosk-model-en-us-0.22.zip', shell=True, stdout=subprocess.PIPE)
-            # p_unzip_vosk.wait()
-            folder_name = self._get_file_info('stt', 'folder')
-            with zipfile.ZipFile(self.model_folders['stt'] + ".zip", 'r') as zip_ref:
-                zip_ref.extractall(self.model_folders['stt'][:-len(folder_name)])
-            print("VOSK Model Unzipped.")
-        except Exception as e:
-            print("VOSK Model Download failed.")
+    def release_models(self):
+        # hand the shared models back to the registry, they stay cached until evicted or unloaded
+        _release_keys(self._registry_keys)
+        self.nlp, self.ssp, self.nlps = None, None, {}
+
+    def _task_nlp(self, task):
+        return self.nlps.get(task, self.nlp)
 
     def _get_ffmpeg_folder_name(self):
         ffmpeg_folder = "ffmpeg-2022-02-24-git-8ef03c2ff1-full_build"
@@ -146,6 +97,15 @@ class ModelLoader:
                 break
         return ffmpeg_folder
 
+    def _get_ffmpeg_path(self):
+        if os.name == 'nt':
+            resources = os.path.join(os.path.expanduser("~"), "multimodal", "resources")
+            if not os.path.isdir(resources):
+                return None
+            ffmpeg_path = os.path.join(resources, self._get_ffmpeg_folder_name(), "bin", "ffmpeg") + '.exe'
+            return ffmpeg_path if os.path.isfile(ffmpeg_path) else None
+        return shutil.which('ffmpeg')
+
     def _check_ffmpeg_download(self):
         if os.name == 'nt':
             ffmpeg_path = os.path.join(os.path.expanduser("~"), "multimodal", "resources",
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def _folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def estimate_model_size(model_obj, folder=None):
+    # transformers pipelines expose the torch module as .model, count its parameters and buffers
+    model = getattr(model_obj, 'model', model_obj)
+    if hasattr(model, 'parameters'):
+        try:
+            tensors = list(model.parameters()) + list(model.buffers())
+            return sum(t.numel() * t.element_size() for t in tensors)
+        except Exception as e:
+            pass
+    # vosk models are opaque, the unpacked folder size is a good proxy of their resident size
+    if folder and os.path.isdir(folder):
+        return _folder_size(folder)
+    return 0
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget=None):
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self._entries = OrderedDict()
+        if memory_budget is None and os.environ.get("MULTIMODAL_MODEL_MEMORY_BUDGET"):
+            memory_budget = int(os.environ["MULTIMODAL_MODEL_MEMORY_BUDGET"])
+        self.memory_budget = memory_budget
+
+    def set_memory_budget(self, memory_budget):
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._evict()
+
+    def acquire(self, key, loader, folder=None):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # load outside the registry lock so that different models can load concurrently
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry['refs'] += 1
+                    self._entries.move_to_end(key)
+                    return entry['model']
+            model_obj = loader()
+            with self._lock:
+                self._entries[key] = {'model': model_obj, 'refs': 1,
+                                      'size': estimate_model_size(model_obj, folder)}
+                self._evict()
+            return model_obj
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['refs'] > 0:
+                entry['refs'] -= 1
+            self._evict()
+
+    def unload(self, key, force=False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry['refs'] > 0 and not force:
+                print("Model " + str(key) + " is still used by " + str(entry['refs']) + " instance(s).")
+                return False
+            del self._entries[key]
+            return True
+
+    def clear(self, force=False):
+        with self._lock:
+            for key in list(self._entries):
+                self.unload(key, force=force)
+
+    def memory_usage(self):
+        with self._lock:
+            return sum(entry['size'] for entry in self._entries.values())
+
+    def info(self):
+        with self._lock:
+            return [{'key': key, 'refs': entry['refs'], 'size': entry['size']} for key, entry in
+                    self._entries.items()]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def _evict(self):
+        # least recently used models go first, models still held by an instance are never evicted
+        if self.memory_budget is None:
+            return
+        usage = self.memory_usage()
+        for key in list(self._entries):
+            if usage <= self.memory_budget:
+                break
+            entry = self._entries[key]
+            if entry['refs'] == 0:
+                usage -= entry['size']
+                del self._entries[key]
+
+
+def _release_keys(keys):
+    for key in keys:
+        registry.release(key)
+    del keys[:]
+
+
+registry = ModelRegistry()
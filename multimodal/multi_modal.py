@@ -1,53 +1,153 @@
-import torch
-from pydub import AudioSegment
-from vosk import KaldiRecognizer, SetLogLevel
 from .audio import Audio
+from .backends import TORCH_MODEL_CLASSES
+from .batching import run_batched
+from .generation import SentenceGenerator
+from .instrumentation import instrumentation
+from .passage_index import BM25Index, sentence_windows
+from .pcm import ms_to_sample_intervals
+from .spans import word_offsets, span_word_indexes
 from .text import Text
 import copy
+import csv
+import importlib
+import json
 import os
-import pandas as pd
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
+# heavy third party modules needed by each mode of tasks.tsv, imported only when a task using the mode is built
+MODE_DEPENDENCIES = {'stt': ['vosk', 'pydub'],
+                     'ner': ['torch', 'transformers'],
+                     'sentiment-analysis': ['torch', 'transformers'],
+                     'question-answering': ['torch', 'transformers'],
+                     'text-generation': ['torch', 'transformers'],
+                     'speak': ['pyttsx3']}
+BASE_CLASSES = {'Text': Text, 'Audio': Audio}
 
-def MultiModal(mmtask, model_path=os.path.join(os.path.expanduser("~"), "multimodal", "resources"), vosk_logger=False):
+
+def _read_tasks():
+    with open(os.path.join(os.path.dirname(__file__), "tasks.tsv"), newline='') as f:
+        return {row['multimodal_task']: row for row in csv.DictReader(f, delimiter='\t')}
+
+
+def _import_task_dependencies(tasks):
+    for task in tasks:
+        for module in MODE_DEPENDENCIES.get(task, []):
+            importlib.import_module(module)
+
+
+def MultiModal(mmtask, model_path=os.path.join(os.path.expanduser("~"), "multimodal", "resources"), vosk_logger=False,
+               transcript_cache=True, transcript_cache_disk=False, stt_workers=1, backend=None, vad=False):
     if not os.path.exists(model_path):
         os.makedirs(model_path)
-    task_df = pd.read_csv(os.path.join(os.path.dirname(__file__), "tasks.tsv"), sep='\t')
-    if not mmtask in task_df['multimodal_task'].values:
-        print("Valid tasks: " + str(list(task_df['multimodal_task'])))
+    task_info = _read_tasks()
+    if not mmtask in task_info:
+        print("Valid tasks: " + str(list(task_info)))
         return
-    base_classes = eval(str(list(task_df[task_df['multimodal_task'] == mmtask]['base']))[2:-2])
-    tasks = eval(list(task_df[task_df['multimodal_task'] == mmtask]['modes'])[0])
+    base_classes = [BASE_CLASSES[base.strip()] for base in task_info[mmtask]['base'].split(',')]
+    tasks = json.loads(task_info[mmtask]['modes'])
+    _import_task_dependencies(tasks)
 
     class MultiModalClass(*base_classes):
-        def __init__(self, mmtask, tasks, model_path, vosk_logger=False):
+        def __init__(self, mmtask, tasks, model_path, vosk_logger=False, transcript_cache=True,
+                     transcript_cache_disk=False, stt_workers=1, backend=None, vad=False):
             for base_class in base_classes:
                 base_class.__init__(self, tasks, model_path)
-            if vosk_logger:
-                SetLogLevel(0)
-            else:
-                SetLogLevel(-1)
+            if 'stt' in tasks:
+                from vosk import SetLogLevel
+                SetLogLevel(0 if vosk_logger else -1)
             # self.device = torch.device('cuda') if torch.cuda.is_available() else torch.device('cpu')
             self.mmtask = mmtask
             self.tasks = tasks
+            self.use_transcript_cache = transcript_cache
+            self.transcript_cache_folder = os.path.join(model_path, "transcripts") if transcript_cache_disk else None
+            self.stt_workers = stt_workers
+            # speech is detected before decoding and silences longer than a second are not sent to the recognizer
+            self.vad = vad
+            # one backend name for every transformers model of the task, or a {mode: backend} dict
+            self.backends = backend if isinstance(backend, dict) else \
+                {mode: backend for mode in tasks if backend and mode in TORCH_MODEL_CLASSES}
             self._download_load_models()
-            self.beep_wf = AudioSegment.from_wav(os.path.join(os.path.dirname(__file__), "resources", "beep.wav"))
+            self._reset_state()
+
+        def _reset_state(self):
+            for base_class in base_classes:
+                if base_class is Text:
+                    self._reset_text_state()
+                elif base_class is Audio:
+                    self._reset_audio_state()
             self.wf_pydub_modified, self.generated_texts, self.sentiment, self.q_answers = {}, {}, {}, {}
+            self.passage_indexes = {}
+            self.pipeline_stats = {}
+            self.mute_intervals = {}
+            self.analysis = {}
+
+        def session(self):
+            # shallow copy sharing the loaded models, with its own per request state, so that one object holding
+            # the models can serve concurrent requests
+            session = copy.copy(self)
+            session._registry_keys = []
+            session._reset_state()
+            return session
 
-        def load(self, path=None, max_pages=2, page_numbers=None, save_folder=None):
+        def evict(self, path=None):
+            # drops what is kept for path (the current input by default): transcript, document text, modified audio
+            # and results. A long lived object otherwise holds on to every file it has been given.
+            if path is None:
+                path = self.pdf_path or self.docx_path or self.audio_path
+            for state in (self.doc, self.file_doc, self.wf_pydub_modified, self.transcripts, self.generated_texts,
+                          self.sentiment, self.mute_intervals, self.analysis, self.pipeline_stats):
+                state.pop(path, None)
+            for key in [key for key in self.q_answers if key[0] == path]:
+                del self.q_answers[key]
+            index_keys = (path, self.audio_hash) if path == self.audio_path else (path,)
+            for key in [key for key in self.passage_indexes if key[0] in index_keys]:
+                del self.passage_indexes[key]
+            if path == self.audio_path:
+                if hasattr(self.wf, 'close'):
+                    self.wf.close()
+                self.wf, self.wf_pydub, self.samples, self.rec = None, None, None, None
+                self.audio_path, self.audio_hash, self.url, self.vad_stats = None, None, None, None
+            if path == self.pdf_path:
+                self.pdf_path = None
+            if path == self.docx_path:
+                self.docx_path, self.docx = None, None
+
+        def load(self, path=None, max_pages=2, page_numbers=None, save_folder=None, workers=None):
             if path and "speech" in mmtask:
                 self._load_audio(path, save_folder)
                 print("Read speech file.")
             elif path and "doc" in mmtask:
                 if path.endswith('pdf'):
-                    self._load_pdf(path, maxpages=max_pages, page_numbers=page_numbers)
+                    self._load_pdf(path, maxpages=max_pages, page_numbers=page_numbers, workers=workers)
                 else:
                     self._load_docx(path)
                 print("Read doc file.")
 
+        def load_pages(self, path, max_pages=0, page_numbers=None, workers=None):
+            # streams (page number, text) of a pdf while the pages are extracted, file_doc is filled once all arrived
+            pages = {}
+            for page_number, text in self._iter_pdf_pages(path, maxpages=max_pages, page_numbers=page_numbers,
+                                                          workers=workers):
+                pages[page_number] = text
+                yield page_number, text
+            self.file_doc[self.pdf_path] = [pages[page_number] for page_number in sorted(pages)]
+
         def export(self, path=None):
             context_path, _ = self._get_input_path()
-            if self.mmtask == 'speech_ner_anonymizer':
+            if 'ner' in self.tasks and self.audio_path in self.mute_intervals:
+                self._export_muted(audio_path=path)
+            elif self.mmtask == 'speech_ner_anonymizer':
                 self._export_pydub(audio_path=path)
+            elif self.mmtask == 'doc_to_audio':
+                if context_path not in self.wf_pydub_modified:
+                    self.render()
+                self._export_pydub(audio_path=path, source_path=context_path, suffix="_audio")
+            elif self.mmtask == 'speech_generation' and context_path in self.wf_pydub_modified:
+                self._export_pydub(audio_path=path, source_path=context_path, suffix="_generated")
             # elif self.mmtask == 'speech_generation':
             #     speak_text = " ".join(self.generated_texts[context_path])
             #     self._export_speak(speak_text, audio_path=path)
@@ -75,56 +175,125 @@ def MultiModal(mmtask, model_path=os.path.join(os.path.expanduser("~"), "multimo
                 for t in self.generated_texts[speak_path]:
                     self._speak(t)
 
+        def render(self, generated=False, workers=None):
+            # offline counterpart of speak, the audio is kept for export instead of being played
+            speak_path, speak_text = self._get_input_path()
+            texts = list(speak_text) + (self.generated_texts.get(speak_path, []) if generated else [])
+            self.wf_pydub_modified[speak_path] = self._render_sentences(texts, workers=workers)
+            return self.wf_pydub_modified[speak_path]
+
         def generate(self, print_processing=True, prompt_context=100, n_sentences=1):
+            for _ in self.generate_stream(prompt_context=prompt_context, n_sentences=n_sentences):
+                pass
+            context_path, _ = self._get_input_path()
+            if print_processing and context_path in self.generated_texts:
+                print(self.generated_texts[context_path])
+            return
+
+        def generate_stream(self, prompt_context=100, n_sentences=1, **generator_options):
+            # yields each generated sentence as soon as it ends, the prompt is encoded once and the model cache reused
             context_path, context_text = self._get_input_path()
-            # context_text = self.doc[context_path]
-            # # Speak existing text
-            # for t in context_text[-2:]:
-            #     self._speak(t)
             if len(context_text):
-                prompt_text = " ".join(context_text)
-                prompt_text = prompt_text.split(" ")[-prompt_context:]
-                # original_len = len(prompt_text)
-                prompt_text = " ".join(prompt_text)
+                prompt_text = " ".join(" ".join(context_text).split(" ")[-prompt_context:])
                 self.generated_texts[context_path] = []
-                while len(self.generated_texts[context_path]) < n_sentences:
-                    complete_text = self.nlp(prompt_text, max_length=250)[0]['generated_text']
-                    self.generated_texts[context_path] += [complete_text[len(prompt_text):]]
-                    prompt_text = complete_text.split(" ")[-prompt_context:]
-                    prompt_text = " ".join(prompt_text)
-                if print_processing:
-                    print(self.generated_texts[context_path])
-            return
+                nlp = self._task_nlp('text-generation')
+                generator = SentenceGenerator(nlp.model, nlp.tokenizer, **generator_options)
+                start = time.perf_counter()
+                for sentence in generator.sentences(prompt_text, n_sentences=n_sentences):
+                    instrumentation.observe_stage('nlp.generate_sentence', time.perf_counter() - start)
+                    instrumentation.count('nlp.generated_sentences')
+                    self.generated_texts[context_path] += [sentence]
+                    yield sentence
+                    start = time.perf_counter()
+
+        def run_pipeline(self, n_sentences=1, prompt_context=100, render=False, queue_size=4, print_processing=False):
+            # listening and generation run on a producer thread, speaking on this one, joined by a bounded queue:
+            # transcript sentences are spoken while decoding goes on, generation starts from the transcript tail as
+            # soon as decoding ends and every generated sentence is spoken (or rendered) as soon as it is produced
+            start = time.perf_counter()
+            stats = {'time_to_first_audio': None, 'time_to_first_generated': None}
+            speech_queue = queue.Queue(maxsize=queue_size)
+            stop = threading.Event()
+            errors = []
+
+            def put(text):
+                # waits for room in the queue unless the consumer has stopped, e.g. on an error while speaking
+                while not stop.is_set():
+                    try:
+                        speech_queue.put(text, timeout=0.1)
+                        return True
+                    except queue.Full:
+                        pass
+                return False
 
+            def produce():
+                try:
+                    self.doc[self.audio_path] = []
+                    for rec_dict in self._recognize():
+                        self.doc[self.audio_path] += [rec_dict['text']]
+                        if rec_dict['text'] and not put(rec_dict['text']):
+                            return
+                    stats['stt_seconds'] = time.perf_counter() - start
+                    for sentence in self.generate_stream(prompt_context=prompt_context, n_sentences=n_sentences):
+                        if stats['time_to_first_generated'] is None:
+                            stats['time_to_first_generated'] = time.perf_counter() - start
+                        if not put(sentence):
+                            return
+                    stats['generation_seconds'] = time.perf_counter() - start - stats['stt_seconds']
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    put(None)
+
+            producer = threading.Thread(target=produce, name="multimodal-pipeline", daemon=True)
+            producer.start()
+            rendered = []
+            try:
+                while True:
+                    text = speech_queue.get()
+                    if text is None:
+                        break
+                    if print_processing:
+                        print(text)
+                    if render:
+                        rendered.append(self._render_sentences([text], workers=1))
+                        if stats['time_to_first_audio'] is None:
+                            stats['time_to_first_audio'] = time.perf_counter() - start
+                    else:
+                        if stats['time_to_first_audio'] is None:
+                            stats['time_to_first_audio'] = time.perf_counter() - start
+                        self._speak(text)
+            finally:
+                stop.set()
+                producer.join()
+            if errors:
+                raise errors[0]
+            if rendered:
+                from pydub import AudioSegment
+                self.wf_pydub_modified[self.audio_path] = AudioSegment(
+                    data=b"".join(sound.raw_data for sound in rendered), sample_width=2, frame_rate=16000, channels=1)
+            stats['total_seconds'] = time.perf_counter() - start
+            self.pipeline_stats[self.audio_path] = stats
+            if print_processing:
+                print(stats)
+            return stats
+
+        @instrumentation.timed('listen')
         def _listen(self, print_sentence=False, sentence_wise=True, task_function=None, return_result=False):
             if self.wf.getnchannels() != 1 or self.wf.getsampwidth() != 2 or self.wf.getcomptype() != "NONE":
                 print("Audio file must be WAV format mono PCM. Converting format ...")
                 self._convert_to_mono(file_path=self.audio_path)
                 print("Conversion successful to 16 KHz mono wave file.")
-                self.load()
+                self._load_audio(self.audio_path)
             self.doc[self.audio_path] = []
             result = []
-            while True:
-                data = self.wf.readframes(4000)
-                if len(data) == 0:
-                    break
-                if self.rec.AcceptWaveform(data):
-                    rec_dict = eval(self.rec.Result())
-                    sentence_text = rec_dict['text']
-                    if print_sentence:
-                        print(sentence_text)
-                    self.doc[self.audio_path] += [sentence_text]
-                    if sentence_wise and task_function:
-                        result.append(task_function(rec_dict))
-                else:
-                    pass
-            rec_dict = eval(self.rec.Result())
-            sentence_text = rec_dict['text']
-            self.doc[self.audio_path] += [sentence_text]
-            if print_sentence:
-                print(sentence_text)
-            if sentence_wise and task_function:
-                result.append(task_function(rec_dict))
+            for rec_dict in self._recognize():
+                sentence_text = rec_dict['text']
+                if print_sentence:
+                    print(sentence_text)
+                self.doc[self.audio_path] += [sentence_text]
+                if sentence_wise and task_function:
+                    result.append(task_function(rec_dict))
             if return_result:
                 return result
             else:
@@ -134,33 +303,148 @@ def MultiModal(mmtask, model_path=os.path.join(os.path.expanduser("~"), "multimo
             self._listen()
             return
 
-        def get_answer(self, question, print_processing=True):
+        def _stream_task_function(self, ner_theta=0.8):
+            # hook run on every final sentence of a live stream, chosen by the task of this object
+            if self.mmtask == 'speech_ner_anonymizer':
+                return lambda rec_dict: self._mute_ner(rec_dict, ner_theta=ner_theta, print_processing=False)
+            elif self.mmtask == 'speech_sentiment':
+                return lambda rec_dict: self._task_nlp('sentiment-analysis')(rec_dict['text'])[0] if rec_dict['text'] else None
+            return None
+
+        def listen_stream(self, chunks, sample_rate=16000, partial=True, task_function=None, ner_theta=0.8):
+            return self.recognize_stream(chunks, sample_rate=sample_rate, partial=partial,
+                                         task_function=task_function or self._stream_task_function(ner_theta))
+
+        def alisten_stream(self, chunks, sample_rate=16000, partial=True, task_function=None, ner_theta=0.8,
+                           executor=None):
+            return self.arecognize_stream(chunks, sample_rate=sample_rate, partial=partial,
+                                          task_function=task_function or self._stream_task_function(ner_theta),
+                                          executor=executor)
+
+        def get_answer(self, question, print_processing=True, top_k=3):
             self._listen(print_sentence=print_processing, sentence_wise=False)
-            answer = self.nlp(question=question, context=".".join(self.doc[self.audio_path]))
-            self.q_answers[(self.audio_path,question)] = [answer]
-            if print_processing:
-                print(answer)
-            return answer
+            return self.get_answers([question], print_processing=print_processing, top_k=top_k, listen=False)[0]
 
-        def get_sentiment(self, print_processing=True):
+        @instrumentation.timed('question_answering')
+        def get_answers(self, questions, print_processing=True, top_k=3, window=3, stride=2, batch_size=16,
+                        listen=True, pipeline=None):
+            # every question is read against its top_k passages only, all pairs go through the pipeline together;
+            # pipeline, a function of the list of pairs, replaces the call of the loaded model
+            if listen:
+                self._listen(sentence_wise=False)
+            index = self._get_passage_index(window, stride)
+            if len(index) == 0:
+                return [None for _ in questions]
+            pairs = [(q, i) for q, question in enumerate(questions) for i in index.search(question, top_k)]
+            inputs = [{'question': questions[q], 'context': index.passages[i]} for q, i in pairs]
+            outputs = pipeline(inputs) if pipeline else run_batched(self._task_nlp('question-answering'), inputs,
+                                                                    batch_size=batch_size,
+                                                                    length=lambda x: len(x['context']))
+            answers = [None for _ in questions]
+            for (q, i), output in zip(pairs, outputs):
+                output = output[0] if isinstance(output, list) else output
+                if answers[q] is None or output['score'] > answers[q]['score']:
+                    answers[q] = dict(output, passage=index.passages[i])
+            for question, answer in zip(questions, answers):
+                self.q_answers[(self.audio_path, question)] = [answer]
+                if print_processing:
+                    print(answer)
+            return answers
+
+        def _get_passage_index(self, window, stride):
+            key = (self.audio_hash or self.audio_path, window, stride)
+            if key not in self.passage_indexes:
+                self.passage_indexes[key] = BM25Index(sentence_windows(self.doc[self.audio_path], window, stride))
+            return self.passage_indexes[key]
+
+        def get_sentiment(self, print_processing=True, recs=None, batch_size=16):
+            if recs is not None:
+                # results of an earlier recognition pass, scored in batches without listening again
+                self.doc[self.audio_path] = [rec_dict['text'] for rec_dict in recs]
+                scores = run_batched(self._task_nlp('sentiment-analysis'), self.doc[self.audio_path],
+                                     batch_size=batch_size)
+                self.sentiment[self.audio_path] = [score if isinstance(score, list) else [score] for score in scores
+                                                   if score is not None]
+                if print_processing:
+                    print(self.sentiment[self.audio_path])
+                return
             self.sentiment[self.audio_path] = []
             self._listen(print_sentence=print_processing, task_function=lambda x: self._get_sentiment(print_processing))
             return
 
+        def stream_sentiment(self, batch_size=8, max_latency=1.0, window=10, print_processing=False):
+            # sentences are scored in micro batches, flushed when batch_size is reached or the oldest buffered
+            # sentence has waited max_latency seconds
+            self.sentiment[self.audio_path] = []
+            self.doc[self.audio_path] = []
+            buffer, buffer_time = [], None
+            window_stars, distribution = deque(maxlen=window), Counter()
+            for rec_dict in self._recognize(tick=True):
+                if rec_dict is not None:
+                    self.doc[self.audio_path] += [rec_dict['text']]
+                    if rec_dict['text']:
+                        buffer.append((len(self.doc[self.audio_path]) - 1, rec_dict))
+                        buffer_time = buffer_time or time.monotonic()
+                if buffer and (len(buffer) >= batch_size or time.monotonic() - buffer_time >= max_latency):
+                    for event in self._score_sentiment(buffer, window_stars, distribution, print_processing):
+                        yield event
+                    buffer, buffer_time = [], None
+            if buffer:
+                for event in self._score_sentiment(buffer, window_stars, distribution, print_processing):
+                    yield event
+
+        def _score_sentiment(self, buffer, window_stars, distribution, print_processing):
+            scores = run_batched(self._task_nlp('sentiment-analysis'), [rec_dict['text'] for _, rec_dict in buffer],
+                                 batch_size=len(buffer))
+            for (index, rec_dict), score in zip(buffer, scores):
+                score = score[0] if isinstance(score, list) else score
+                self.sentiment[self.audio_path] += [[score]]
+                # labels of the multilingual sentiment model are "1 star" to "5 stars"
+                stars = int(score['label'].split(" ")[0]) if score['label'][:1].isdigit() else None
+                if stars is not None:
+                    window_stars.append(stars)
+                    distribution[stars] += 1
+                words = rec_dict.get('result', [])
+                event = {'index': index, 'text': rec_dict['text'], 'sentiment': score, 'stars': stars,
+                         'start': words[0]['start'] if words else None, 'end': words[-1]['end'] if words else None,
+                         'window_mean': sum(window_stars) / len(window_stars) if window_stars else None,
+                         'distribution': {k: v / sum(distribution.values()) for k, v in sorted(distribution.items())}}
+                if print_processing:
+                    print(event)
+                yield event
+
         def _get_sentiment(self, print_processing):
             # rec_dict = eval(self.rec.Result())
-            sentiment_score = self.nlp(self.doc[self.audio_path][-1])
+            with instrumentation.stage('nlp.call', task='sentiment-analysis'):
+                sentiment_score = self._task_nlp('sentiment-analysis')(self.doc[self.audio_path][-1])
             self.sentiment[self.audio_path] += [sentiment_score]
             if print_processing:
                 print(sentiment_score)
             return
 
-        def anonymize(self, ner_theta=0.8, ner_window_gap=0.2, return_audio=True, print_processing=True):
-            self.wf_pydub_modified[self.audio_path] = copy.deepcopy(self.wf_pydub)
-            mute_rec = self._listen(print_sentence=print_processing, return_result=True,
-                                    task_function=lambda x: self._mute_ner(x, ner_theta=ner_theta,
-                                                                           print_processing=print_processing))
+        @instrumentation.timed('anonymize')
+        def anonymize(self, ner_theta=0.8, ner_window_gap=0.2, return_audio=True, print_processing=True,
+                      batch_size=16, engine='pydub', fill='beep', memmap=False, recs=None):
+            # engine='numpy' keeps only the mute intervals, beep or silence (fill) overwrites them in place and
+            # export() streams the result in one pass; a 16 bit mono wav is read from its memory map (memmap=True maps
+            # the file also when the samples are held in memory).
+            # The pydub engine replaces every muted span with the whole beep, changing the length of the audio.
+            if engine not in ('pydub', 'numpy') or fill not in ('beep', 'silence'):
+                raise ValueError("engine must be 'pydub' or 'numpy' and fill 'beep' or 'silence'")
+            # recs: results of an earlier recognition pass, used instead of listening again
+            rec_dicts = list(recs) if recs is not None else \
+                self._listen(print_sentence=print_processing, return_result=True, task_function=lambda x: x)
+            # NER runs over length bucketed batches of sentences instead of one pipeline call per sentence
+            rec_ners = run_batched(self._task_nlp('ner'), [rec_dict['text'] for rec_dict in rec_dicts],
+                                   batch_size=batch_size, empty_result=[])
+            mute_rec = [self._mute_ner(rec_dict, ner_theta=ner_theta, print_processing=print_processing,
+                                       rec_ner=rec_ner) for rec_dict, rec_ner in zip(rec_dicts, rec_ners)]
             mute_rec = [self._enlarge_window(rec, ner_window_gap) for recs in mute_rec for rec in recs]
+            if engine == 'numpy':
+                return self._anonymize_samples(mute_rec, fill, memmap, return_audio)
+            self.mute_intervals.pop(self.audio_path, None)
+            # segments are immutable, the recording is only copied where beeps are spliced in
+            self.wf_pydub_modified[self.audio_path] = self.wf_pydub
             if len(mute_rec) > 0:
                 # fix overlapping time durations
                 mute_rec_fix = [(mute_rec[0][0], mute_rec[0][1])]
@@ -180,14 +464,126 @@ def MultiModal(mmtask, model_path=os.path.join(os.path.expanduser("~"), "multimo
             else:
                 return
 
-        def _mute_ner(self, rec_dict, ner_theta, print_processing):
-            rec_ner = self.nlp(rec_dict["text"])
-            rec_ner = list(filter(lambda x: x['score'] > ner_theta, rec_ner))
-            rec_ner = self._merge_rec_ner(rec_dict["text"], rec_ner)
-            ner_tokens = [tok for span in rec_ner for tok in span['text'].split(" ")]
-            ner_tokens_rec = list(filter(lambda x: any([x['word'] in ner_tokens]), rec_dict['result']))  # change
+        def _anonymize_samples(self, mute_rec, fill, memmap, return_audio):
+            intervals = ms_to_sample_intervals(mute_rec, self.wf.getframerate(), self.wf.getnframes())
+            self.mute_intervals[self.audio_path] = (intervals, fill, memmap)
+            self.wf_pydub_modified.pop(self.audio_path, None)
+            if not return_audio:
+                return
+            from pydub import AudioSegment
+            samples, rate = self._muted_samples(intervals, fill, memmap)
+            self.wf_pydub_modified[self.audio_path] = AudioSegment(data=samples.tobytes(), sample_width=2,
+                                                                   frame_rate=rate, channels=1)
+            return self.wf_pydub_modified[self.audio_path]
+
+        @instrumentation.timed('analyze')
+        def analyze(self, questions=(), ner_theta=0.8, ner_window_gap=0.2, top_k=3, batch_size=16,
+                    print_processing=False, recs=None, pipelines=None):
+            # every pipeline of the task over one recognition pass: recognized sentences are handed in batches to
+            # the ner and sentiment pipelines while decoding goes on, each pipeline on its own thread so that they
+            # run side by side, questions are answered once the transcript is complete. recs are the results of an
+            # earlier recognition pass, pipelines maps a mode to a function of a list of inputs used instead of the
+            # loaded model, e.g. the batch queues of the server, which call every pipeline from one thread only
+            pipelines = dict(pipelines or {})
+            for mode in self.nlps:
+                pipelines.setdefault(mode, self._batched_pipeline(mode, batch_size))
+            analyzers = [mode for mode in ('ner', 'sentiment-analysis') if mode in self.nlps]
+            executors = {mode: ThreadPoolExecutor(max_workers=1, thread_name_prefix="multimodal-" + mode)
+                         for mode in self.nlps if mode in analyzers or mode == 'question-answering'}
+            futures = {mode: [] for mode in analyzers}
+            pending = []
+
+            def submit():
+                texts = [rec_dict['text'] for rec_dict in pending]
+                for mode in analyzers:
+                    futures[mode].append(executors[mode].submit(pipelines[mode], texts))
+                del pending[:]
+
+            def fan_out(rec_dict):
+                pending.append(rec_dict)
+                if len(pending) >= batch_size:
+                    submit()
+                return rec_dict
+
+            start = time.perf_counter()
+            try:
+                if recs is None:
+                    rec_dicts = self._listen(print_sentence=print_processing, return_result=True,
+                                             task_function=fan_out)
+                else:
+                    rec_dicts = [fan_out(rec_dict) for rec_dict in recs]
+                    self.doc[self.audio_path] = [rec_dict['text'] for rec_dict in rec_dicts]
+                if pending:
+                    submit()
+                stt_seconds = time.perf_counter() - start
+                answers = executors['question-answering'].submit(
+                    self.get_answers, list(questions), print_processing=False, top_k=top_k, batch_size=batch_size,
+                    listen=False, pipeline=pipelines['question-answering']) \
+                    if questions and 'question-answering' in executors else None
+                outputs = {mode: [output for future in futures[mode] for output in future.result()]
+                           for mode in analyzers}
+                answers = answers.result() if answers else []
+            finally:
+                for executor in executors.values():
+                    executor.shutdown(wait=True)
+            sentences, mute_rec = [], []
+            for i, rec_dict in enumerate(rec_dicts):
+                words = rec_dict.get('result', [])
+                sentence = {'index': i, 'text': rec_dict['text'], 'start': words[0]['start'] if words else None,
+                            'end': words[-1]['end'] if words else None}
+                if 'ner' in outputs:
+                    sentence['entities'] = self._ner_spans(rec_dict['text'], outputs['ner'][i], ner_theta)
+                    sentence['muted'] = self._span_words(rec_dict, sentence['entities'])
+                    mute_rec += [self._enlarge_window(rec, ner_window_gap) for rec in sentence['muted']]
+                if 'sentiment-analysis' in outputs:
+                    score = outputs['sentiment-analysis'][i]
+                    sentence['sentiment'] = score[0] if isinstance(score, list) else score
+                sentences.append(sentence)
+            if 'ner' in outputs:
+                # export() writes the recording with the entities beeped
+                self._anonymize_samples(mute_rec, 'beep', False, return_audio=False)
+            if 'sentiment-analysis' in outputs:
+                self.sentiment[self.audio_path] = [[sentence['sentiment']] for sentence in sentences
+                                                   if sentence['sentiment'] is not None]
+            self.analysis[self.audio_path] = {
+                'transcript': [rec_dict['text'] for rec_dict in rec_dicts], 'sentences': sentences,
+                'answers': [dict(answer, question=question) if answer else None
+                            for question, answer in zip(questions, answers)],
+                'stats': {'stt_seconds': stt_seconds, 'total_seconds': time.perf_counter() - start}}
+            if print_processing:
+                print(self.analysis[self.audio_path])
+            return self.analysis[self.audio_path]
+
+        def _batched_pipeline(self, mode, batch_size):
+            if mode == 'question-answering':
+                return lambda inputs: run_batched(self.nlps[mode], inputs, batch_size=batch_size,
+                                                  length=lambda x: len(x['context']))
+            return lambda texts: run_batched(self.nlps[mode], texts, batch_size=batch_size,
+                                             empty_result=[] if mode == 'ner' else None)
+
+        def _mute_ner(self, rec_dict, ner_theta, print_processing, rec_ner=None):
+            if rec_ner is None:
+                with instrumentation.stage('nlp.call', task='ner'):
+                    rec_ner = self._task_nlp('ner')(rec_dict["text"])
+            ner_tokens_rec = self._span_words(rec_dict, self._ner_spans(rec_dict["text"], rec_ner, ner_theta))
             if print_processing:
                 print(ner_tokens_rec)
             return ner_tokens_rec
 
-    return MultiModalClass(mmtask, tasks, model_path, vosk_logger)
+        def _ner_spans(self, text, rec_ner, ner_theta):
+            return self._merge_rec_ner(text, [x for x in rec_ner if x['score'] > ner_theta])
+
+        def _span_words(self, rec_dict, rec_ner):
+            words = rec_dict.get('result', [])
+            word_texts = [x['word'] for x in words]
+            offsets = word_offsets(rec_dict["text"], word_texts)
+            if offsets is not None:
+                # only the words under an entity span are muted, not every repeat of the same word
+                ner_tokens_rec = [words[i] for i in span_word_indexes(offsets, word_texts, rec_ner)]
+            else:
+                ner_tokens = set(tok for span in rec_ner for tok in span['text'].split(" "))
+                ner_tokens_rec = [x for x in words if x['word'] in ner_tokens]
+            return ner_tokens_rec
+
+    return MultiModalClass(mmtask, tasks, model_path, vosk_logger, transcript_cache, transcript_cache_disk,
+                           stt_workers, backend, vad)
@@ -0,0 +1,55 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def sentence_windows(sentences, window=3, stride=2):
+    # overlapping passages of consecutive sentences, the last window always reaches the end of the transcript
+    sentences = [sentence for sentence in sentences if sentence]
+    if len(sentences) <= window:
+        return [". ".join(sentences)] if sentences else []
+    starts = list(range(0, len(sentences) - window + 1, stride))
+    if starts[-1] != len(sentences) - window:
+        starts.append(len(sentences) - window)
+    return [". ".join(sentences[start:start + window]) for start in starts]
+
+
+class BM25Index:
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1, self.b = k1, b
+        self.lengths = []
+        # inverted index, term -> [(passage, term frequency)]
+        self.postings = defaultdict(list)
+        for i, passage in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((i, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def _idf(self, term):
+        df = len(self.postings.get(term, []))
+        return math.log(1 + (len(self.passages) - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=3):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf(term)
+            for i, tf in self.postings.get(term, []):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / (self.avg_length or 1.0))
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))[:top_k]
+        # questions sharing no word with the transcript still get passages to read
+        if len(ranked) < top_k:
+            ranked += [i for i in range(len(self.passages)) if i not in scores][:top_k - len(ranked)]
+        return ranked
+
+    def __len__(self):
+        return len(self.passages)
@@ -0,0 +1,252 @@
+import os
+import struct
+import subprocess
+import threading
+import wave
+from bisect import bisect_right
+from contextlib import contextmanager
+import numpy as np
+
+
+def frame_rms(samples, frame_length, block_frames=4096):
+    # root mean square per frame, computed block wise so long recordings are never copied to float at once
+    n_frames = len(samples) // frame_length
+    rms = np.empty(n_frames, dtype=np.float32)
+    for first in range(0, n_frames, block_frames):
+        last = min(first + block_frames, n_frames)
+        frames = np.asarray(samples[first * frame_length:last * frame_length], dtype=np.float32)
+        frames = frames.reshape(last - first, frame_length)
+        rms[first:last] = np.sqrt(np.mean(frames * frames, axis=1))
+    return rms
+
+
+def frame_zcr(samples, frame_length, block_frames=4096):
+    # zero crossing rate per frame, the share of neighbouring samples changing sign
+    n_frames = len(samples) // frame_length
+    zcr = np.empty(n_frames, dtype=np.float32)
+    for first in range(0, n_frames, block_frames):
+        last = min(first + block_frames, n_frames)
+        frames = np.asarray(samples[first * frame_length:last * frame_length]).reshape(last - first, frame_length)
+        zcr[first:last] = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+    return zcr
+
+
+def speech_regions(samples, rate, frame_ms=30, energy_ratio=3.0, min_rms=50.0, zcr_range=(0.1, 0.5), pad_ms=300,
+                   min_silence_ms=1000):
+    # (start, end) sample ranges holding speech. A frame is speech when its energy is well above the noise floor (a
+    # low percentile of the frame energies), or moderately above it with a zero crossing rate of unvoiced speech.
+    # Speech frames are padded by pad_ms and only silences of at least min_silence_ms are cut.
+    frame_length = int(rate * frame_ms / 1000)
+    if len(samples) < frame_length:
+        return [(0, len(samples))]
+    rms = frame_rms(samples, frame_length)
+    zcr = frame_zcr(samples, frame_length)
+    threshold = max(np.percentile(rms, 10) * energy_ratio, min_rms)
+    speech = (rms > threshold) | ((rms > threshold / 2) & (zcr > zcr_range[0]) & (zcr < zcr_range[1]))
+    pad = int(pad_ms / frame_ms)
+    speech = np.convolve(speech.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32), mode='same') > 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    regions = []
+    min_silence = int(min_silence_ms / frame_ms)
+    for start, end in zip(edges[::2], edges[1::2]):
+        if regions and start - regions[-1][1] < min_silence:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    last_sample = len(samples)
+    return [(int(start) * frame_length, min(int(end) * frame_length, last_sample) if end < len(speech)
+             else last_sample) for start, end in regions]
+
+
+def compress_regions(samples, regions, rate, gap_ms=300):
+    # the speech regions joined with a short silence between them, and the offset map (start in the compressed
+    # samples, start in the original samples) of every region
+    gap = np.zeros(int(rate * gap_ms / 1000), dtype='<i2')
+    parts, offset_map, position = [], [], 0
+    for start, end in regions:
+        if parts:
+            parts.append(gap)
+            position += len(gap)
+        parts.append(np.asarray(samples[start:end], dtype='<i2'))
+        offset_map.append((position, start))
+        position += end - start
+    compressed = np.concatenate(parts) if parts else np.zeros(0, dtype='<i2')
+    return compressed, offset_map
+
+
+def restore_rec_times(rec_dict, offset_map, rate):
+    # word times of a decode over compressed samples back on the timeline of the original recording
+    compressed_starts = [compressed / rate for compressed, _ in offset_map]
+    for word in rec_dict.get('result', []):
+        for key in ('start', 'end'):
+            i = max(bisect_right(compressed_starts, word[key]) - 1, 0)
+            word[key] = round(word[key] + (offset_map[i][1] - offset_map[i][0]) / rate, 6)
+    return rec_dict
+
+
+def split_points(samples, rate, n_chunks, search_seconds=5.0, frame_ms=30, pause_ms=300):
+    # sample indices cutting the recording into n_chunks, each cut moved to the quietest pause near its target
+    frame_length = int(rate * frame_ms / 1000)
+    if n_chunks <= 1 or len(samples) < 2 * frame_length:
+        return [0, len(samples)]
+    rms = frame_rms(samples, frame_length)
+    pause_frames = max(1, int(pause_ms / frame_ms))
+    smoothed = np.convolve(rms, np.ones(pause_frames, dtype=np.float32) / pause_frames, mode='same')
+    search_frames = int(search_seconds * 1000 / frame_ms)
+    points = [0]
+    for i in range(1, n_chunks):
+        target = int(len(rms) * i / n_chunks)
+        first = max(target - search_frames, 1)
+        last = min(target + search_frames, len(rms) - 1)
+        if last <= first:
+            continue
+        cut = (first + int(np.argmin(smoothed[first:last]))) * frame_length + frame_length // 2
+        if cut > points[-1]:
+            points.append(cut)
+    points.append(len(samples))
+    return points
+
+
+def shift_rec_times(rec_dict, offset):
+    for word in rec_dict.get('result', []):
+        word['start'] = round(word['start'] + offset, 6)
+        word['end'] = round(word['end'] + offset, 6)
+    return rec_dict
+
+
+def decode_ffmpeg(ffmpeg_path, path, frequency=16000, block_size=1 << 20):
+    # one ffmpeg pass decodes, downmixes and resamples to 16 bit mono, read straight from its stdout
+    command = [ffmpeg_path, '-nostdin', '-loglevel', 'error', '-i', path, '-f', 's16le', '-acodec', 'pcm_s16le',
+               '-ac', '1', '-ar', str(frequency), '-']
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    data = bytearray()
+    for block in iter(lambda: process.stdout.read(block_size), b''):
+        data += block
+    error = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError("ffmpeg failed to decode " + path + ": " + error.decode(errors='replace').strip())
+    del data[len(data) - len(data) % 2:]
+    return np.frombuffer(data, dtype='<i2')
+
+
+def wav_memmap(path):
+    # int16 view of the data chunk of a 16 bit mono PCM wav, pages are read from disk on demand
+    with wave.open(path, "rb") as wf:
+        n_frames, rate = wf.getnframes(), wf.getframerate()
+    with open(path, 'rb') as f:
+        if f.read(12)[8:] != b'WAVE':
+            raise ValueError(path + " is not a wav file")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(path + " has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'data':
+                offset = f.tell()
+                break
+            f.seek(size + (size & 1), 1)
+    return np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(n_frames,)), rate
+
+
+def ms_to_sample_intervals(intervals, rate, n_samples):
+    # (start ms, end ms) pairs to sorted, merged, clipped (start, end) sample indices
+    merged = []
+    for start, end in sorted((max(0, start * rate // 1000), min(n_samples, -(-end * rate // 1000)))
+                             for start, end in intervals):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+
+def fill_pattern(pattern, offset, length):
+    # pattern repeated from offset, None is silence
+    if pattern is None:
+        return 0
+    return np.take(pattern, np.arange(offset, offset + length) % len(pattern))
+
+
+def apply_fill(samples, intervals, pattern=None, first=0, ends=None):
+    # overwrite the parts of the block samples (starting at sample first) covered by the intervals, in place
+    last = first + len(samples)
+    ends = np.array([end for _, end in intervals]) if ends is None else ends
+    i = int(np.searchsorted(ends, first, side='right'))
+    while i < len(intervals) and intervals[i][0] < last:
+        start, end = max(intervals[i][0], first), min(intervals[i][1], last)
+        samples[start - first:end - first] = fill_pattern(pattern, start - intervals[i][0], end - start)
+        i += 1
+    return samples
+
+
+@contextmanager
+def replacing(path):
+    # yields a path next to path to write to, renamed over path once written: a memory map of the file being
+    # replaced, e.g. the recording an export overwrites, keeps reading the old data instead of a truncated file
+    tmp_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_filled_wav(path, samples, rate, intervals, pattern=None, block_frames=1 << 16):
+    # one pass over samples (an array or memmap), each block copied, filled and written, so memory stays at one block
+    with replacing(path) as tmp_path, wave.open(tmp_path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        ends = np.array([end for _, end in intervals])
+        for first in range(0, len(samples), block_frames):
+            block = np.array(samples[first:first + block_frames], dtype='<i2')
+            wf.writeframes(apply_fill(block, intervals, pattern, first, ends).tobytes())
+
+
+class PcmReader:
+    # read only wave.Wave_read look-alike over 16 bit mono samples held in memory
+    def __init__(self, samples, framerate):
+        self.samples = samples
+        self.framerate = framerate
+        self._position = 0
+
+    def getnchannels(self):
+        return 1
+
+    def getsampwidth(self):
+        return 2
+
+    def getcomptype(self):
+        return "NONE"
+
+    def getframerate(self):
+        return self.framerate
+
+    def getnframes(self):
+        return len(self.samples)
+
+    def readframes(self, n):
+        data = self.samples[self._position:self._position + n].tobytes()
+        self._position = min(self._position + n, len(self.samples))
+        return data
+
+    def rewind(self):
+        self._position = 0
+
+    def tell(self):
+        return self._position
+
+    def setpos(self, position):
+        self._position = position
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,239 @@
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# written last into a provisioned folder, a folder without it is an interrupted download or extraction
+COMPLETE_MARKER = ".multimodal_complete"
+# what a folder without the marker must hold to be kept, each entry one of a list of paths: a vosk model, otherwise
+# a transformers model with its config, weights and tokenizer
+REQUIRED_FILES = {'stt': [["am/final.mdl"], ["conf"]]}
+HUB_FILES = [["config.json"],
+             ["pytorch_model.bin", "model.safetensors", "pytorch_model.bin.index.json", "model.safetensors.index.json",
+              "tf_model.h5"],
+             ["tokenizer.json", "vocab.txt", "vocab.json", "spiece.model", "sentencepiece.bpe.model"]]
+_folder_locks = {}
+_folder_locks_lock = threading.Lock()
+
+
+class ProvisioningError(RuntimeError):
+    pass
+
+
+def _folder_lock(folder):
+    with _folder_locks_lock:
+        return _folder_locks.setdefault(os.path.abspath(folder), threading.Lock())
+
+
+def file_sha256(path, block_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def mirror_url(url, base_url=None):
+    # MULTIMODAL_MODEL_MIRROR (or base_url) serves the archives under their file names, e.g. a local http server
+    base_url = base_url or os.environ.get("MULTIMODAL_MODEL_MIRROR")
+    if not base_url or not _is_url(url):
+        return url
+    return base_url.rstrip("/") + "/" + url.rstrip("/").split("/")[-1]
+
+
+def _is_url(url):
+    return url.startswith("http://") or url.startswith("https://")
+
+
+def download(url, path, sha256=None, retries=5, timeout=60, block_size=1 << 20):
+    # bytes go to path + ".part", an interrupted download resumes from its size with an http range request, the
+    # file is checked and renamed to path only when complete
+    part_path = path + ".part"
+    for attempt in range(retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        request = urllib.request.Request(url, headers={'Range': 'bytes=' + str(offset) + '-'} if offset else {})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if offset and response.status != 206:
+                    # the server ignores ranges, start over
+                    offset = 0
+                length = response.headers.get('Content-Length')
+                expected = offset + int(length) if length is not None else None
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for block in iter(lambda: response.read(block_size), b''):
+                        f.write(block)
+            if expected is None or os.path.getsize(part_path) >= expected:
+                break
+            error = "connection closed after {} of {} bytes".format(os.path.getsize(part_path), expected)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # nothing left to send, the part file is already complete
+                break
+            if e.code < 500:
+                raise ProvisioningError("Download of " + url + " failed: HTTP " + str(e.code))
+            error = "HTTP " + str(e.code)
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            error = repr(e)
+        if attempt == retries:
+            raise ProvisioningError("Download of " + url + " failed after " + str(retries + 1) + " attempts: " +
+                                    error)
+        print("Download of " + url + " interrupted (" + error + "), resuming ...")
+        time.sleep(min(2 ** attempt, 30))
+    if sha256:
+        digest = file_sha256(part_path)
+        if digest != sha256.lower():
+            os.remove(part_path)
+            raise ProvisioningError("Checksum mismatch for " + url + ": expected " + sha256 + ", got " + digest)
+    os.replace(part_path, path)
+    return path
+
+
+def _write_marker(folder, source):
+    with open(os.path.join(folder, COMPLETE_MARKER), 'w') as f:
+        json.dump({'source': source, 'time': time.time()}, f)
+
+
+def extract_zip(zip_path, folder):
+    # extracted next to folder, checked and renamed into place, so folder either is complete or does not exist
+    parent = os.path.dirname(os.path.abspath(folder))
+    extract_folder = tempfile.mkdtemp(prefix="." + os.path.basename(folder) + "-", dir=parent)
+    try:
+        with zipfile.ZipFile(zip_path) as zip_ref:
+            bad_member = zip_ref.testzip()
+            if bad_member is not None:
+                raise ProvisioningError("Corrupt archive " + zip_path + ", CRC error in " + bad_member)
+            for name in zip_ref.namelist():
+                target = os.path.abspath(os.path.join(extract_folder, name))
+                if not target.startswith(os.path.abspath(extract_folder) + os.sep):
+                    raise ProvisioningError("Archive " + zip_path + " has a member outside its folder: " + name)
+            zip_ref.extractall(extract_folder)
+        entries = os.listdir(extract_folder)
+        # archives usually hold one top folder, named like the model folder
+        root = os.path.join(extract_folder, entries[0]) if len(entries) == 1 and \
+            os.path.isdir(os.path.join(extract_folder, entries[0])) else extract_folder
+        _write_marker(root, os.path.basename(zip_path))
+        os.rename(root, folder)
+    except zipfile.BadZipFile as e:
+        raise ProvisioningError("Corrupt archive " + zip_path + ": " + str(e))
+    finally:
+        shutil.rmtree(extract_folder, ignore_errors=True)
+    return folder
+
+
+def is_complete(task, folder):
+    return all(any(os.path.exists(os.path.join(folder, path)) for path in paths)
+               for paths in REQUIRED_FILES.get(task, HUB_FILES))
+
+
+def is_provisioned(task, folder):
+    if os.path.isfile(os.path.join(folder, COMPLETE_MARKER)):
+        return True
+    if os.path.isdir(folder) and is_complete(task, folder):
+        # a folder without the marker was downloaded before the marker existed or unpacked by hand, it is kept
+        # when it holds the whole model; older versions could leave a partial extraction, which is not
+        _write_marker(folder, "existing folder")
+        return True
+    return False
+
+
+def _provision_archive(info, folder, base_url=None):
+    url = mirror_url(info['url'], base_url)
+    zip_path = folder + ".zip"
+    if not info.get('sha256'):
+        print("No sha256 in file_info.csv for " + info['url'] + ", the download is not verified.")
+    if os.path.isfile(zip_path) and info.get('sha256') and file_sha256(zip_path) != info['sha256'].lower():
+        os.remove(zip_path)
+    if not os.path.isfile(zip_path):
+        print("Downloading " + url + " ...")
+        download(url, zip_path, sha256=info.get('sha256'))
+        print("Downloaded " + os.path.basename(zip_path) + ".")
+    try:
+        extract_zip(zip_path, folder)
+    except ProvisioningError:
+        # a corrupt archive is downloaded again next time
+        os.remove(zip_path)
+        raise
+    os.remove(zip_path)
+    print("Unzipped " + os.path.basename(folder) + ".")
+    return folder
+
+
+def _provision_transformers(task, info, folder):
+    # transformers hub downloads are cached and verified by huggingface_hub, the folder is written aside and renamed
+    import transformers
+    from .backends import TORCH_MODEL_CLASSES
+    parent = os.path.dirname(os.path.abspath(folder))
+    save_folder = tempfile.mkdtemp(prefix="." + os.path.basename(folder) + "-", dir=parent)
+    try:
+        print("Downloading " + info['url'] + " ...")
+        transformers.AutoTokenizer.from_pretrained(info['url']).save_pretrained(save_folder)
+        getattr(transformers, TORCH_MODEL_CLASSES[task]).from_pretrained(info['url']).save_pretrained(save_folder)
+        _write_marker(save_folder, info['url'])
+        os.rename(save_folder, folder)
+        print("Downloaded " + info['url'] + ".")
+    except ProvisioningError:
+        raise
+    except Exception as e:
+        raise ProvisioningError("Download of " + info['url'] + " failed: " + repr(e))
+    finally:
+        shutil.rmtree(save_folder, ignore_errors=True)
+    return folder
+
+
+def provision_artifact(task, info, model_path, base_url=None):
+    folder = os.path.join(model_path, info['folder'])
+    with _folder_lock(folder):
+        if is_provisioned(task, folder):
+            return folder
+        os.makedirs(model_path, exist_ok=True)
+        if os.path.isdir(folder):
+            print("Removing incomplete model folder " + folder + ".")
+            shutil.rmtree(folder)
+        if _is_url(info['url']):
+            return _provision_archive(info, folder, base_url)
+        return _provision_transformers(task, info, folder)
+
+
+def provision(file_info, tasks, model_path, workers=4, base_url=None):
+    # every missing artifact of tasks is downloaded once, independent ones in parallel; raises with all failures
+    tasks = [task for task in dict.fromkeys(tasks) if task in file_info and
+             not is_provisioned(task, os.path.join(model_path, file_info[task]['folder']))]
+    if not tasks:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tasks)))) as executor:
+        futures = {task: executor.submit(provision_artifact, task, file_info[task], model_path, base_url)
+                   for task in tasks}
+    errors = {task: future.exception() for task, future in futures.items() if future.exception() is not None}
+    if errors:
+        raise ProvisioningError("Model provisioning failed: " + "; ".join(task + ": " + str(error)
+                                                                         for task, error in errors.items()))
+    return {task: future.result() for task, future in futures.items()}
+
+
+def main(argv=None):
+    # prints the sha256 of the model archives of file_info.csv, for its sha256 column
+    import argparse
+    from .model_loader import _read_file_info
+    parser = argparse.ArgumentParser(description="Download the model archives and print their sha256.")
+    parser.add_argument("tasks", nargs="*", help="rows of file_info.csv, all archives by default")
+    args = parser.parse_args(argv)
+    file_info = _read_file_info()
+    for task in args.tasks or [task for task, info in file_info.items() if _is_url(info['url'])]:
+        folder = tempfile.mkdtemp(prefix="multimodal-sha256-")
+        try:
+            path = download(mirror_url(file_info[task]['url']), os.path.join(folder, "archive.zip"))
+            print(task + "," + file_sha256(path))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
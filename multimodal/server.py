@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from .backends import BACKENDS
+from .batching import BatchQueue, run_batched
+from .instrumentation import instrumentation
+from .multi_modal import MultiModal, _read_tasks
+from .model_loader import _read_file_info
+from .provisioning import is_provisioned
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.expanduser("~"), "multimodal", "resources")
+# the transformers pipeline behind the single pipeline tasks
+TASK_PIPELINES = {'speech_ner_anonymizer': 'ner', 'speech_sentiment': 'sentiment-analysis',
+                  'speech_question_answering': 'question-answering'}
+
+
+def _use_offline_models(model_path, tasks):
+    # the server never downloads, every model folder must already be under model_path
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    file_info = _read_file_info()
+    task_info = _read_tasks()
+    missing = set()
+    for mmtask in tasks:
+        for mode in json.loads(task_info[mmtask]['modes']):
+            if mode in file_info and not is_provisioned(mode, os.path.join(model_path, file_info[mode]['folder'])):
+                missing.add(os.path.join(model_path, file_info[mode]['folder']))
+    if missing:
+        raise RuntimeError("Model folders missing, load the tasks once with network access first: " +
+                           ", ".join(sorted(missing)))
+
+
+def _json_default(value):
+    # numpy scalars (pipeline scores) and arrays as numbers, anything else as its string
+    if hasattr(value, 'item') and hasattr(value, 'dtype'):
+        return value.item() if value.ndim == 0 else value.tolist()
+    return str(value)
+
+
+class ModelServer:
+    def __init__(self, tasks=None, model_path=DEFAULT_MODEL_PATH, max_batch_size=16, max_wait=0.01, stt_workers=4,
+                 backend=None):
+        self.tasks = tasks or list(_read_tasks())
+        _use_offline_models(model_path, self.tasks)
+        self.models, self.queues, self.pipeline_queues = {}, {}, {}
+        for mmtask in self.tasks:
+            start = time.perf_counter()
+            self.models[mmtask] = MultiModal(mmtask, model_path=model_path, backend=backend)
+            print("Loaded " + mmtask + " in {:.1f} s.".format(time.perf_counter() - start))
+            # one queue per pipeline, shared by every task using it, so a pipeline (and its fast tokenizer) is only
+            # ever called from its queue thread
+            for mode, nlp in self.models[mmtask].nlps.items():
+                batch_function = self._batch_function(mode, nlp)
+                if batch_function and mode not in self.pipeline_queues:
+                    self.pipeline_queues[mode] = BatchQueue(batch_function, max_batch_size=max_batch_size,
+                                                            max_wait=max_wait, name=mode)
+            if mmtask in TASK_PIPELINES:
+                self.queues[mmtask] = self.pipeline_queues[TASK_PIPELINES[mmtask]]
+            elif mmtask == 'speech_generation':
+                # sentence wise generation keeps its own model cache per prompt, the batch is generated in turn
+                self.queues[mmtask] = BatchQueue(lambda requests: [self._generate(*request) for request in requests],
+                                                 max_batch_size=max_batch_size, max_wait=max_wait, name=mmtask)
+        self._stt_slots = threading.BoundedSemaphore(stt_workers)
+        self._lock = threading.Lock()
+        self.request_counts = {mmtask: 0 for mmtask in self.tasks}
+        self.started = time.time()
+
+    def _batch_function(self, mode, nlp):
+        if mode == 'ner':
+            return lambda texts: run_batched(nlp, texts, batch_size=len(texts), empty_result=[])
+        elif mode == 'sentiment-analysis':
+            return lambda texts: run_batched(nlp, texts, batch_size=len(texts))
+        elif mode == 'question-answering':
+            return lambda pairs: run_batched(nlp, pairs, batch_size=len(pairs), length=lambda x: len(x['context']))
+        return None
+
+    def _generate(self, context_text, n_sentences):
+        session = self.models['speech_generation'].session()
+        session.doc['request'], session.audio_path = context_text, 'request'
+        return list(session.generate_stream(n_sentences=n_sentences))
+
+    def _transcribe(self, session, body, suffix):
+        # the request body is written once to a temporary file for the decoder and removed right after loading, the
+        # samples are read into memory rather than mapped from the file
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+            f.write(body)
+        session.memmap_audio = False
+        try:
+            with self._stt_slots:
+                session.load(f.name)
+                return session._listen(return_result=True, task_function=lambda rec_dict: rec_dict)
+        finally:
+            os.remove(f.name)
+
+    def handle(self, mmtask, body, query, content_type):
+        with self._lock:
+            self.request_counts[mmtask] += 1
+        session = self.models[mmtask].session()
+        suffix = "." + query.get('ext', ["wav"])[0]
+        if mmtask == 'doc_to_audio':
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+                f.write(body)
+            try:
+                session.load(f.name, max_pages=int(query.get('max_pages', [2])[0]))
+                return {'text': session.file_doc[f.name]}
+            finally:
+                os.remove(f.name)
+        if mmtask == 'speech_generation' and content_type.startswith("application/json"):
+            request = json.loads(body)
+            context_text = [request['text']] if isinstance(request['text'], str) else request['text']
+            return {'generated': self.queues[mmtask](
+                (context_text, int(request.get('n_sentences', query.get('n_sentences', [1])[0]))))}
+        rec_dicts = self._transcribe(session, body, suffix)
+        if mmtask == 'speech_analysis':
+            # the stt slot is free again, the pipelines are reached through their queues only
+            return session.analyze(questions=query.get('question', []),
+                                   ner_theta=float(query.get('ner_theta', [0.8])[0]),
+                                   top_k=int(query.get('top_k', [3])[0]), recs=rec_dicts,
+                                   pipelines={mode: q.map for mode, q in self.pipeline_queues.items()})
+        transcript = [rec_dict['text'] for rec_dict in rec_dicts]
+        if mmtask == 'speech_sentiment':
+            scores = self.queues[mmtask].map(transcript)
+            return {'transcript': transcript, 'sentiment': [score[0] if isinstance(score, list) else score
+                                                            for score in scores]}
+        elif mmtask == 'speech_ner_anonymizer':
+            ner_theta = float(query.get('ner_theta', [0.8])[0])
+            rec_ners = self.queues[mmtask].map(transcript)
+            muted = [session._mute_ner(rec_dict, ner_theta, False, rec_ner=rec_ner)
+                     for rec_dict, rec_ner in zip(rec_dicts, rec_ners)]
+            return {'transcript': transcript, 'muted': [word for words in muted for word in words]}
+        elif mmtask == 'speech_question_answering':
+            questions = query.get('question', [])
+            top_k = int(query.get('top_k', [3])[0])
+            answers = session.get_answers(questions, listen=False, top_k=top_k, print_processing=False,
+                                          pipeline=self.queues[mmtask].map)
+            return {'transcript': transcript, 'answers': answers}
+        elif mmtask == 'speech_generation':
+            n_sentences = int(query.get('n_sentences', [1])[0])
+            return {'transcript': transcript, 'generated': self.queues[mmtask]((transcript, n_sentences))}
+
+    def stats(self):
+        return {'uptime': time.time() - self.started, 'requests': dict(self.request_counts),
+                'queues': {mmtask: q.stats() for mmtask, q in self.queues.items()},
+                'pipelines': {mode: q.stats() for mode, q in self.pipeline_queues.items()}}
+
+    def close(self):
+        for q in set(self.queues.values()) | set(self.pipeline_queues.values()):
+            q.close()
+
+
+def _make_handler(model_server):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload, content_type="application/json"):
+            body = payload.encode() if isinstance(payload, str) else json.dumps(payload, default=_json_default).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urlparse(self.path).path.strip("/")
+            if path == "stats":
+                self._reply(200, model_server.stats())
+            elif path == "metrics":
+                # Prometheus text format, empty unless the server runs with instrumentation enabled
+                self._reply(200, instrumentation.to_prometheus(), content_type="text/plain; version=0.0.4")
+            elif path == "metrics.json":
+                self._reply(200, instrumentation.snapshot())
+            elif path in ("", "tasks"):
+                self._reply(200, {'tasks': model_server.tasks})
+            else:
+                self._reply(404, {'error': "unknown path " + path})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            mmtask = url.path.strip("/")
+            if mmtask not in model_server.models:
+                self._reply(404, {'error': "task not served: " + mmtask, 'tasks': model_server.tasks})
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                result = model_server.handle(mmtask, body, parse_qs(url.query),
+                                             self.headers.get("Content-Type", ""))
+                self._reply(200, result)
+            except Exception as e:
+                self._reply(500, {'error': repr(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(tasks=None, host="127.0.0.1", port=8765, model_path=DEFAULT_MODEL_PATH, max_batch_size=16, max_wait=0.01,
+          stt_workers=4, backend=None):
+    model_server = ModelServer(tasks, model_path=model_path, max_batch_size=max_batch_size, max_wait=max_wait,
+                               stt_workers=stt_workers, backend=backend)
+    httpd = ThreadingHTTPServer((host, port), _make_handler(model_server))
+    print("Serving " + ", ".join(model_server.tasks) + " on http://" + host + ":" + str(port))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        model_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local multimodal inference server.")
+    parser.add_argument("--tasks", nargs="*", help="tasks of tasks.tsv to preload, all by default")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model-path", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--stt-workers", type=int, default=4)
+    parser.add_argument("--metrics", action="store_true", help="record stage timings, served on /metrics")
+    parser.add_argument("--backend", choices=BACKENDS, help="fp32, int8 or onnx for the transformers models")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        instrumentation.enable()
+    serve(args.tasks, host=args.host, port=args.port, model_path=args.model_path, max_batch_size=args.max_batch_size,
+          max_wait=args.max_wait_ms / 1000, stt_workers=args.stt_workers, backend=args.backend)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+from bisect import bisect_left, bisect_right
+
+
+def entity_type(label):
+    # "B-PER" and "I-PER" are both pieces of a "PER" entity
+    return label[2:] if label[:2] in ("B-", "I-") else label
+
+
+def merge_entity_pieces(text, pieces):
+    # one pass in start order: a piece extends the open span when it starts exactly where the span ends and has the
+    # same entity type, otherwise it opens a new span. The score of a span is the lowest of its pieces.
+    spans = []
+    for piece in sorted(pieces, key=lambda x: (x['start'], x['end'])):
+        tag = entity_type(piece['entity'])
+        if spans and spans[-1]['endPosition'] == piece['start'] and spans[-1]['conceptType'] == tag:
+            spans[-1]['endPosition'] = max(spans[-1]['endPosition'], piece['end'])
+            spans[-1]['score'] = min(spans[-1]['score'], piece['score'])
+        else:
+            spans.append({'beginPosition': piece['start'], 'endPosition': piece['end'], 'conceptType': tag,
+                          'score': piece['score']})
+    for span in spans:
+        span['text'] = text[span['beginPosition']:span['endPosition']]
+    return spans
+
+
+def word_offsets(text, words):
+    # character offset of every recognized word in the sentence text, None when a word can not be found in order
+    offsets, position = [], 0
+    for word in words:
+        start = text.find(word, position)
+        if start < 0:
+            return None
+        offsets.append(start)
+        position = start + len(word)
+    return offsets
+
+
+def span_word_indexes(offsets, words, spans):
+    # indexes of the words overlapping any span, a span starting or ending inside a word covers the whole word
+    indexes = set()
+    for span in spans:
+        first = max(bisect_right(offsets, span['beginPosition']) - 1, 0)
+        last = bisect_left(offsets, span['endPosition'])
+        for i in range(first, last):
+            if offsets[i] + len(words[i]) > span['beginPosition']:
+                indexes.add(i)
+    return sorted(indexes)
@@ -1,52 +1,126 @@
-import docx
-
+from .instrumentation import instrumentation
 from .model_loader import ModelLoader
-from pdfminer.high_level import extract_text
+from .spans import merge_entity_pieces
+from .transcript_cache import file_content_hash
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
+import threading
+
+# extracted pdf pages by (file hash, page number), shared by every object of the process
+_pdf_page_cache = OrderedDict()
+_pdf_page_cache_lock = threading.Lock()
+PDF_PAGE_CACHE_SIZE = 2000
+
+
+def _pdf_page_count(pdf_path):
+    from pdfminer.pdfpage import PDFPage
+    with open(pdf_path, 'rb') as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+
+def _extract_pdf_pages(pdf_path, page_numbers):
+    # text of each requested page, same layout analysis as pdfminer's extract_text
+    from io import StringIO
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    wanted, pages = set(page_numbers), []
+    resource_manager = PDFResourceManager()
+    with open(pdf_path, 'rb') as f:
+        for page_number, page in enumerate(PDFPage.get_pages(f)):
+            if page_number > max(wanted):
+                break
+            if page_number not in wanted:
+                continue
+            output = StringIO()
+            device = TextConverter(resource_manager, output, laparams=LAParams())
+            PDFPageInterpreter(resource_manager, device).process_page(page)
+            device.close()
+            pages.append((page_number, output.getvalue()))
+    return pages
+
+
+def _cache_pdf_page(file_hash, page_number, text):
+    with _pdf_page_cache_lock:
+        _pdf_page_cache[(file_hash, page_number)] = text
+        _pdf_page_cache.move_to_end((file_hash, page_number))
+        while len(_pdf_page_cache) > PDF_PAGE_CACHE_SIZE:
+            _pdf_page_cache.popitem(last=False)
 
 
 class Text(ModelLoader):
     def __init__(self, tasks, model_path):
         super(Text, self).__init__(self, model_path)
+        self._reset_text_state()
+        # self.tasks = ["ner"]
+
+    def _reset_text_state(self):
         self.doc = {}
         self.file_doc = {}
         self.pdf_path = None
         self.docx_path = None
         self.docx = None
-        # self.tasks = ["ner"]
 
-    def _load_pdf(self, pdf_path=None, maxpages=2, page_numbers=None):
+    @instrumentation.timed('doc.extract', format='pdf')
+    def _load_pdf(self, pdf_path=None, maxpages=2, page_numbers=None, workers=None):
+        pages = dict(self._iter_pdf_pages(pdf_path, maxpages=maxpages, page_numbers=page_numbers, workers=workers))
+        self.file_doc[self.pdf_path] = [pages[page_number] for page_number in sorted(pages)]
+
+    def _iter_pdf_pages(self, pdf_path=None, maxpages=2, page_numbers=None, workers=None, pages_per_task=4):
+        # yields (page number, text) as soon as each page is ready, pages extracted before come from the cache and
+        # the missing ones are spread over a process pool
         if os.path.exists(pdf_path):
             self.pdf_path = pdf_path
-        self.file_doc[self.pdf_path] = [extract_text(pdf_path, maxpages=maxpages, page_numbers=page_numbers)]
+        file_hash = file_content_hash(self.pdf_path)
+        # as in pdfminer, maxpages counts the pages of the document, not the requested ones
+        if page_numbers:
+            wanted = sorted(page_number for page_number in set(page_numbers) if not maxpages or page_number < maxpages)
+        elif maxpages:
+            wanted = list(range(maxpages))
+        else:
+            wanted = list(range(_pdf_page_count(self.pdf_path)))
+        missing = []
+        for page_number in wanted:
+            with _pdf_page_cache_lock:
+                text = _pdf_page_cache.get((file_hash, page_number))
+            if text is None:
+                missing.append(page_number)
+            else:
+                instrumentation.count('doc.pages', source='cache')
+                yield page_number, text
+        if len(missing) > pages_per_task:
+            # pages past the end would each cost a parse of the whole document in a worker
+            page_count = _pdf_page_count(self.pdf_path)
+            missing = [page_number for page_number in missing if page_number < page_count]
+        if not missing:
+            return
+        tasks = [missing[i:i + pages_per_task] for i in range(0, len(missing), pages_per_task)]
+        if len(tasks) == 1 or workers == 1:
+            done = (_extract_pdf_pages(self.pdf_path, task) for task in tasks)
+        else:
+            executor = ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(tasks)))
+            futures = [executor.submit(_extract_pdf_pages, self.pdf_path, task) for task in tasks]
+            done = (future.result() for future in as_completed(futures))
+        try:
+            for pages in done:
+                for page_number, text in pages:
+                    instrumentation.count('doc.pages', source='extracted')
+                    _cache_pdf_page(file_hash, page_number, text)
+                    yield page_number, text
+        finally:
+            if len(tasks) > 1 and workers != 1:
+                executor.shutdown(wait=False, cancel_futures=True)
 
+    @instrumentation.timed('doc.extract', format='docx')
     def _load_docx(self, docx_path=None):
+        import docx
         if os.path.exists(docx_path):
             self.docx_path = docx_path
         self.docx = docx.Document(self.docx_path)
         self.file_doc[self.docx_path] = [para.text for para in self.docx.paragraphs]
 
+    @instrumentation.timed('ner.merge')
     def _merge_rec_ner(self, text, prediction):
-        merged_prediction = []
-        while len(prediction) > 0:
-            prediction.sort(key=lambda x: x['start'])
-            current = prediction[0]
-            current_tag = prediction[0]['entity'][2:]
-            neighbours = list(filter(
-                lambda x: (current['start'] == x['end'] or current['end'] == x['start']) and current['entity'][2:] ==
-                          x['entity'][2:], prediction))
-            if len(neighbours) >= 1:
-                start = min([current] + neighbours, key=lambda x: x['start'])['start']
-                end = max([current] + neighbours, key=lambda x: x['end'])['end']
-                score = min([current] + neighbours, key=lambda x: x['score'])['score']
-                prediction.append({'start': start, 'end': end, 'entity': current_tag, 'score': score})
-                for neighbour in neighbours:
-                    prediction.remove(neighbour)
-            else:
-                merged_prediction.append(
-                    {'beginPosition': current['start'], 'endPosition': current['end'], 'conceptType': current_tag,
-                     'score': current['score']})
-            prediction.remove(current)
-        for entity in merged_prediction:
-            entity['text'] = text[entity['beginPosition']:entity['endPosition']]
-        return merged_prediction
+        return merge_entity_pieces(text, prediction)
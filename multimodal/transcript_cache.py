@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def file_content_hash(path, block_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def transcript_key(audio_hash, model_folder, variant=None):
+    # the model folder name identifies the STT model, the same model unpacked elsewhere gives the same transcript;
+    # variant tells apart decodes of the same audio done differently, e.g. with voice activity detection
+    key = audio_hash + "-" + os.path.basename(os.path.normpath(model_folder))
+    return key + "-" + variant if variant else key
+
+
+class TranscriptCache:
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def get(self, key, disk_folder=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        recs = self._read_disk(key, disk_folder)
+        with self._lock:
+            if recs is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._put_memory(key, recs)
+        return recs
+
+    def put(self, key, recs, disk_folder=None):
+        with self._lock:
+            self._put_memory(key, recs)
+        if disk_folder:
+            self._write_disk(key, recs, disk_folder)
+
+    def invalidate(self, key, disk_folder=None):
+        with self._lock:
+            self._entries.pop(key, None)
+        if disk_folder and os.path.isfile(os.path.join(disk_folder, key + ".json")):
+            os.remove(os.path.join(disk_folder, key + ".json"))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _put_memory(self, key, recs):
+        self._entries[key] = recs
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _read_disk(self, key, disk_folder):
+        if not disk_folder:
+            return None
+        path = os.path.join(disk_folder, key + ".json")
+        if not os.path.isfile(path):
+            return None
+        from .transcript_store import TranscriptStore
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except ValueError as e:
+            print("Ignoring corrupt transcript cache file " + path)
+            return None
+        # a list of results, or an object with the voice activity statistics of the recording as well
+        recs = TranscriptStore(data['recs'] if isinstance(data, dict) else data)
+        if isinstance(data, dict):
+            recs.vad_stats = data.get('vad_stats')
+        return recs
+
+    def _write_disk(self, key, recs, disk_folder):
+        if not os.path.exists(disk_folder):
+            os.makedirs(disk_folder, exist_ok=True)
+        path = os.path.join(disk_folder, key + ".json")
+        # write next to the target and rename, readers never see a half written transcript
+        tmp_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+        vad_stats = getattr(recs, 'vad_stats', None)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'recs': list(recs), 'vad_stats': vad_stats} if vad_stats else list(recs), f)
+        os.replace(tmp_path, path)
+
+
+transcript_cache = TranscriptCache()
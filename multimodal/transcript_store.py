@@ -0,0 +1,111 @@
+import numpy as np
+
+COLUMN_TYPES = {'word': np.int32, 'start': np.float64, 'end': np.float64, 'conf': np.float64, 'sentence': np.int32}
+
+
+class TranscriptStore:
+    # the vosk results of one recording as columns, one row per recognized word: id of the word in the string table,
+    # start and end in seconds, confidence and index of its sentence. Iterating gives back the vosk result dicts,
+    # sentence by sentence, so a store can stand in for the list of results.
+    def __init__(self, recs=(), capacity=1024):
+        self.strings = []
+        self._string_ids = {}
+        self.texts = []
+        self._offsets = [0]
+        self._columns = {name: np.empty(capacity, dtype) for name, dtype in COLUMN_TYPES.items()}
+        self.n_words = 0
+        # statistics of the voice activity detection the recording was decoded with, kept with the cached transcript
+        self.vad_stats = None
+        for rec_dict in recs:
+            self.append(rec_dict)
+
+    def _string_id(self, string):
+        if string not in self._string_ids:
+            self._string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return self._string_ids[string]
+
+    def _reserve(self, n_words):
+        capacity = len(self._columns['word'])
+        if n_words <= capacity:
+            return
+        while capacity < n_words:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, column.dtype)
+            grown[:self.n_words] = column[:self.n_words]
+            self._columns[name] = grown
+
+    def append(self, rec_dict):
+        words = rec_dict.get('result', [])
+        first, last = self.n_words, self.n_words + len(words)
+        self._reserve(last)
+        self._columns['word'][first:last] = [self._string_id(word['word']) for word in words]
+        self._columns['start'][first:last] = [word['start'] for word in words]
+        self._columns['end'][first:last] = [word['end'] for word in words]
+        self._columns['conf'][first:last] = [word.get('conf', 1.0) for word in words]
+        self._columns['sentence'][first:last] = len(self.texts)
+        self.texts.append(rec_dict.get('text', ""))
+        self.n_words = last
+        self._offsets.append(last)
+        return rec_dict
+
+    def column(self, name):
+        # a view of the rows appended so far, no copy
+        return self._columns[name][:self.n_words]
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values())
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        return self.sentence(index)
+
+    def __iter__(self):
+        for index in range(len(self.texts)):
+            yield self.sentence(index)
+
+    def words(self, rows):
+        word, start, end, conf = (self._columns[name][rows].tolist() for name in ('word', 'start', 'end', 'conf'))
+        return [{'conf': conf[i], 'end': end[i], 'start': start[i], 'word': self.strings[word[i]]}
+                for i in range(len(word))]
+
+    def sentence(self, index):
+        # the vosk result dict of a sentence, rebuilt on request
+        index = range(len(self.texts))[index]
+        rec_dict = {'text': self.texts[index]}
+        if self._offsets[index + 1] > self._offsets[index]:
+            rec_dict['result'] = self.words(slice(self._offsets[index], self._offsets[index + 1]))
+        return rec_dict
+
+    def time_range(self, start=0.0, end=float('inf')):
+        # rows of the words overlapping [start, end) seconds
+        return np.flatnonzero((self.column('end') > start) & (self.column('start') < end))
+
+    def words_between(self, start=0.0, end=float('inf')):
+        return self.words(self.time_range(start, end))
+
+    def text_between(self, start=0.0, end=float('inf')):
+        return " ".join(self.strings[i] for i in self.column('word')[self.time_range(start, end)].tolist())
+
+    def sentences_between(self, start=0.0, end=float('inf')):
+        return np.unique(self.column('sentence')[self.time_range(start, end)]).tolist()
+
+    def to_arrow(self):
+        # numeric columns are handed to arrow without copying, words as a dictionary column over the string table
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Arrow and Parquet export need pyarrow: pip install pyarrow")
+        word = pa.DictionaryArray.from_arrays(pa.array(self.column('word')), pa.array(self.strings, pa.string()))
+        return pa.table([word] + [pa.array(self.column(name)) for name in ('start', 'end', 'conf', 'sentence')],
+                        names=list(COLUMN_TYPES))
+
+    def to_parquet(self, path, **options):
+        table = self.to_arrow()
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, **options)
+        return path
@@ -24,8 +24,11 @@ setup(
     ],
     keywords="sample, setuptools, development",  # Optional
     packages=find_packages(),
-    python_requires=">=2.7",
+    python_requires=">=3.9",
     include_package_data=True,  # to include manifest.in
+    entry_points={
+        "console_scripts": ["multimodal-server=multimodal.server:main"],
+    },
     install_requires=[
         "patool",
         'pyunpack',
@@ -35,10 +38,8 @@ setup(
         'torch',
         "transformers",
         "numpy",
-        "pandas",
         "pdfminer.six",
-        "pyttsx3==2.7",
-        "python-docx",
-        "gdown"
+        "pyttsx3>=2.90",
+        "python-docx"
     ]
 )
\ No newline at end of file
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from multimodal.pcm import speech_regions, compress_regions, restore_rec_times
+
+RATE = 1000
+
+
+def test_compress_regions_joins_regions_with_a_silent_gap():
+    samples = np.arange(100, dtype='<i2')
+    compressed, offset_map = compress_regions(samples, [(10, 20), (50, 70)], RATE, gap_ms=10)
+    assert offset_map == [(0, 10), (20, 50)]
+    assert compressed.tolist() == list(range(10, 20)) + [0] * 10 + list(range(50, 70))
+
+
+def test_compress_no_regions():
+    compressed, offset_map = compress_regions(np.arange(100, dtype='<i2'), [], RATE)
+    assert len(compressed) == 0 and offset_map == []
+
+
+def test_restore_rec_times_moves_words_back_to_their_region():
+    rec_dict = {'text': "one two", 'result': [{'word': "one", 'start': 0.005, 'end': 0.008},
+                                              {'word': "two", 'start': 0.025, 'end': 0.03}]}
+    restore_rec_times(rec_dict, [(0, 10), (20, 50)], RATE)
+    assert [(word['start'], word['end']) for word in rec_dict['result']] == [(0.015, 0.018), (0.055, 0.06)]
+
+
+def test_word_in_the_inserted_gap_keeps_its_order():
+    # the word starts in the silence between the regions and ends in the second region
+    rec_dict = {'text': "gap", 'result': [{'word': "gap", 'start': 0.012, 'end': 0.022}]}
+    restore_rec_times(rec_dict, [(0, 10), (20, 50)], RATE)
+    word = rec_dict['result'][0]
+    assert word['start'] == pytest.approx(0.022)
+    assert word['end'] == pytest.approx(0.052)
+    assert word['start'] < word['end']
+
+
+def test_sentence_without_words_is_unchanged():
+    assert restore_rec_times({'text': ""}, [(0, 10)], RATE) == {'text': ""}
+
+
+def test_speech_region_of_a_tone_between_silences():
+    rate = 16000
+    tone = (3000 * np.sin(2 * np.pi * 440 * np.arange(rate) / rate)).astype('<i2')
+    silence = np.zeros(2 * rate, dtype='<i2')
+    samples = np.concatenate([silence, tone, silence])
+    regions = speech_regions(samples, rate)
+    assert len(regions) == 1
+    start, end = regions[0]
+    assert 0 < start <= 2 * rate and 3 * rate <= end < len(samples)
+    compressed, offset_map = compress_regions(samples, regions, rate)
+    assert len(compressed) == end - start
+    # the first word of the tone lands back at 2 s of the recording
+    rec_dict = {'text': "a", 'result': [{'word': "a", 'start': (2 * rate - start) / rate, 'end': 1.0}]}
+    restore_rec_times(rec_dict, offset_map, rate)
+    assert rec_dict['result'][0]['start'] == pytest.approx(2.0)
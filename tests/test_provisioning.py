@@ -0,0 +1,118 @@
+import hashlib
+import io
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from multimodal import provisioning
+
+FOLDER = "vosk-model-test"
+URL = "https://alphacephei.com/vosk/models/" + FOLDER + ".zip"
+
+
+def make_archive():
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as zip_ref:
+        zip_ref.writestr(FOLDER + "/am/final.mdl", os.urandom(1 << 20))
+        zip_ref.writestr(FOLDER + "/conf/model.conf", b"--sample-frequency=16000")
+    return data.getvalue()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # serves the archive under its file name with range requests, the first drops_left responses are cut short
+    monkeypatch.setattr(provisioning.time, "sleep", lambda seconds: None)
+    state = {'archive': make_archive(), 'drops_left': 0, 'ranges': []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.strip("/") != FOLDER + ".zip":
+                self.send_error(404)
+                return
+            requested = self.headers.get('Range')
+            state['ranges'].append(requested)
+            start = int(requested.split("=")[1].rstrip("-")) if requested else 0
+            body = state['archive'][start:]
+            self.send_response(206 if requested else 200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if state['drops_left']:
+                state['drops_left'] -= 1
+                self.wfile.write(body[:len(body) // 3])
+                self.wfile.flush()
+                self.connection.shutdown(2)
+                return
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    state['base_url'] = "http://127.0.0.1:" + str(http_server.server_port)
+    yield state
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def file_info(sha256):
+    return {'stt': {'task': 'stt', 'folder': FOLDER, 'url': URL, 'sha256': sha256}}
+
+
+def test_interrupted_download_resumes_with_range(server, tmp_path):
+    server['drops_left'] = 1
+    sha256 = hashlib.sha256(server['archive']).hexdigest()
+    provisioning.provision(file_info(sha256), ['stt'], str(tmp_path), base_url=server['base_url'])
+    assert server['ranges'][0] is None
+    assert server['ranges'][1] == "bytes=" + str(len(server['archive']) // 3) + "-"
+    folder = tmp_path / FOLDER
+    assert (folder / provisioning.COMPLETE_MARKER).is_file()
+    assert (folder / "am" / "final.mdl").is_file()
+    # archive, part file and extraction folder are gone
+    assert sorted(os.listdir(tmp_path)) == [FOLDER]
+
+
+def test_checksum_mismatch_raises_and_leaves_no_folder(server, tmp_path):
+    with pytest.raises(provisioning.ProvisioningError, match="Checksum mismatch"):
+        provisioning.provision(file_info("0" * 64), ['stt'], str(tmp_path), base_url=server['base_url'])
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_download_keeps_part_file_and_no_folder(server, tmp_path):
+    server['drops_left'] = 10
+    with pytest.raises(provisioning.ProvisioningError, match="failed after"):
+        provisioning.download(server['base_url'] + "/" + FOLDER + ".zip", str(tmp_path / "archive.zip"), retries=2)
+    # nothing appears under the final name until the download is complete
+    assert os.listdir(tmp_path) == ["archive.zip.part"]
+
+
+def test_complete_folder_without_marker_is_kept(server, tmp_path):
+    folder = tmp_path / FOLDER
+    (folder / "am").mkdir(parents=True)
+    (folder / "conf").mkdir()
+    (folder / "am" / "final.mdl").write_bytes(b"unpacked by hand")
+    provisioning.provision(file_info(""), ['stt'], str(tmp_path), base_url=server['base_url'])
+    assert server['ranges'] == []
+    assert (folder / "am" / "final.mdl").read_bytes() == b"unpacked by hand"
+    assert (folder / provisioning.COMPLETE_MARKER).is_file()
+
+
+def test_partial_folder_without_marker_is_provisioned_again(server, tmp_path):
+    # an extraction interrupted by an older version, the model files are missing
+    folder = tmp_path / FOLDER
+    (folder / "am").mkdir(parents=True)
+    (folder / "am" / "final.mdl").write_bytes(b"partial")
+    provisioning.provision(file_info(""), ['stt'], str(tmp_path), base_url=server['base_url'])
+    assert server['ranges'] == [None]
+    assert (folder / "am" / "final.mdl").read_bytes() != b"partial"
+    assert (folder / "conf" / "model.conf").is_file()
+    assert (folder / provisioning.COMPLETE_MARKER).is_file()
+
+
+def test_hub_folder_needs_config_weights_and_tokenizer(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    (tmp_path / "model.safetensors").write_bytes(b"")
+    assert not provisioning.is_complete('ner', str(tmp_path))
+    (tmp_path / "vocab.txt").write_text("[PAD]")
+    assert provisioning.is_complete('ner', str(tmp_path))
@@ -0,0 +1,57 @@
+from multimodal.spans import merge_entity_pieces, word_offsets, span_word_indexes
+
+TEXT = "the cat and the hat"
+WORDS = TEXT.split()
+
+
+def test_pieces_merge_when_adjacent_and_of_the_same_type():
+    text = "Leonardo visited Paris"
+    pieces = [{'entity': 'B-LOC', 'start': 17, 'end': 22, 'score': 0.99},
+              {'entity': 'I-PER', 'start': 3, 'end': 8, 'score': 0.8},
+              {'entity': 'B-PER', 'start': 0, 'end': 3, 'score': 0.95}]
+    assert merge_entity_pieces(text, pieces) == [
+        {'beginPosition': 0, 'endPosition': 8, 'conceptType': 'PER', 'score': 0.8, 'text': "Leonardo"},
+        {'beginPosition': 17, 'endPosition': 22, 'conceptType': 'LOC', 'score': 0.99, 'text': "Paris"}]
+
+
+def test_pieces_stay_apart_across_a_gap_or_a_type_change():
+    text = "ParisHilton Leonardo DiCaprio"
+    pieces = [{'entity': 'B-LOC', 'start': 0, 'end': 5, 'score': 0.9},
+              {'entity': 'B-PER', 'start': 5, 'end': 11, 'score': 0.9},
+              {'entity': 'B-PER', 'start': 12, 'end': 20, 'score': 0.9},
+              {'entity': 'I-PER', 'start': 21, 'end': 29, 'score': 0.9}]
+    assert [span['text'] for span in merge_entity_pieces(text, pieces)] == ["Paris", "Hilton", "Leonardo",
+                                                                              "DiCaprio"]
+
+
+def test_no_pieces_no_spans():
+    assert merge_entity_pieces(TEXT, []) == []
+
+
+def test_word_offsets_of_repeated_words():
+    assert word_offsets(TEXT, WORDS) == [0, 4, 8, 12, 16]
+
+
+def test_word_offsets_none_when_a_word_is_missing_or_out_of_order():
+    assert word_offsets(TEXT, ["the", "dog"]) is None
+    assert word_offsets(TEXT, ["cat", "the", "the"]) is None
+
+
+def test_span_over_a_repeated_word_marks_only_that_one():
+    spans = [{'beginPosition': 12, 'endPosition': 15}]
+    assert span_word_indexes(word_offsets(TEXT, WORDS), WORDS, spans) == [3]
+
+
+def test_span_starting_or_ending_mid_word_covers_the_whole_word():
+    offsets = word_offsets(TEXT, WORDS)
+    assert span_word_indexes(offsets, WORDS, [{'beginPosition': 5, 'endPosition': 11}]) == [1, 2]
+    assert span_word_indexes(offsets, WORDS, [{'beginPosition': 16, 'endPosition': 17}]) == [4]
+
+
+def test_span_between_words_covers_nothing():
+    assert span_word_indexes(word_offsets(TEXT, WORDS), WORDS, [{'beginPosition': 3, 'endPosition': 4}]) == []
+
+
+def test_overlapping_spans_give_each_word_once():
+    spans = [{'beginPosition': 4, 'endPosition': 11}, {'beginPosition': 0, 'endPosition': 7}]
+    assert span_word_indexes(word_offsets(TEXT, WORDS), WORDS, spans) == [0, 1, 2]
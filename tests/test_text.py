@@ -0,0 +1,23 @@
+import os
+import pytest
+from multimodal.text import Text, _pdf_page_cache
+
+pdfminer_high_level = pytest.importorskip("pdfminer.high_level")
+PDF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files", "1907.11932.pdf")
+
+
+def pdfminer_pages(maxpages, page_numbers):
+    # extract_text separates pages with a form feed
+    text = pdfminer_high_level.extract_text(PDF_PATH, maxpages=maxpages, page_numbers=page_numbers)
+    return [page + "\f" for page in text.split("\f")[:-1]]
+
+
+@pytest.mark.parametrize("maxpages, page_numbers", [(2, None), (0, [3, 1]), (2, [3, 1]), (3, [4, 0, 2]),
+                                                    (1, [0]), (2, []), (50, None)])
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pdf_pages_match_pdfminer(maxpages, page_numbers, workers):
+    _pdf_page_cache.clear()
+    text = Text.__new__(Text)
+    text._reset_text_state()
+    text._load_pdf(PDF_PATH, maxpages=maxpages, page_numbers=page_numbers, workers=workers)
+    assert text.file_doc[PDF_PATH] == pdfminer_pages(maxpages, page_numbers)
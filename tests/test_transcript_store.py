@@ -0,0 +1,40 @@
+import pytest
+from multimodal.transcript_store import TranscriptStore
+
+RECS = [{'result': [{'conf': 1.0, 'end': 0.5, 'start': 0.0, 'word': "the"},
+                    {'conf': 0.75, 'end': 1.0, 'start': 0.5, 'word': "cat"}], 'text': "the cat"},
+        {'text': ""},
+        {'result': [{'conf': 0.5, 'end': 1.5, 'start': 1.0, 'word': "the"},
+                    {'conf': 0.123456789, 'end': 2.5, 'start': 1.5, 'word': "hat"}], 'text': "the hat"}]
+
+
+def test_round_trip():
+    store = TranscriptStore(RECS)
+    assert list(store) == RECS
+    assert len(store) == 3 and store.n_words == 4
+    assert store[-1] == RECS[-1]
+
+
+def test_round_trip_beyond_the_initial_capacity():
+    store = TranscriptStore(RECS, capacity=1)
+    assert list(store) == RECS
+
+
+def test_repeated_words_share_a_string():
+    assert TranscriptStore(RECS).strings == ["the", "cat", "hat"]
+
+
+def test_time_range_leaves_out_words_touching_its_ends():
+    store = TranscriptStore(RECS)
+    assert store.time_range(0.5, 1.5).tolist() == [1, 2]
+    assert store.text_between(0.5, 1.5) == "cat the"
+    assert store.sentences_between(0.5, 1.5) == [0, 2]
+    assert store.words_between(2.0) == RECS[2]['result'][1:]
+    assert store.text_between(3.0) == ""
+
+
+def test_to_arrow_columns():
+    pytest.importorskip("pyarrow")
+    table = TranscriptStore(RECS).to_arrow()
+    assert table.column('word').to_pylist() == ["the", "cat", "the", "hat"]
+    assert table.column('sentence').to_pylist() == [0, 0, 2, 2]